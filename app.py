@@ -1,17 +1,24 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 import os
+import copy
 import time
+import hashlib
+import threading
+import uuid
 import datetime
-import base64
+import shutil
 import zipfile
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
 from io import BytesIO
+from typing import Optional
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-from backend import DatabaseManager, AuthService, InvoiceExtractor, InvoiceService, SystemService, ExportService, User, \
-    logger
-from classification import classify_pdfs, move_to_output
+from backend import DatabaseManager, AuthService, InvoiceExtractor, InvoiceService, InvoiceWriter, SystemService, \
+    ExportService, User, extract_invoice_worker, logger
+from classification import classify_pdfs_parallel, file_digest
 
 # 设置页面配置
 st.set_page_config(
@@ -22,178 +29,283 @@ st.set_page_config(
 )
 
 
+# 样式文件路径
+STYLES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "styles.css")
+
+
+@st.cache_resource
+def _load_css():
+    """读取自定义样式（每个进程只读取一次）"""
+    with open(STYLES_PATH, encoding="utf-8") as f:
+        return f.read()
+
+
 # 应用自定义样式
 def apply_custom_styles():
-    st.markdown("""
-    <style>
-        /* 主容器响应式布局 */
-        .stApp {
-            background-color: #f8f9fa;
-            font-family: 'Microsoft YaHei', Arial, sans-serif;
-        }
+    st.markdown(f"<style>{_load_css()}</style>", unsafe_allow_html=True)
 
-        /* 侧边栏样式 */
-        section[data-testid="stSidebar"] {
-            background: linear-gradient(135deg, #6a8fcc 0%, #7a9fdc 100%);
-            min-width: 280px !important;
-            max-width: 320px !important;
-        }
 
-        .sidebar-content {
-            color: white;
-            padding: 10px;
-        }
+apply_custom_styles()
 
-        .sidebar-title {
-            color: white !important;
-            font-weight: 800 !important;
-            font-size: 30px !important;
-            text-align: center;
-            margin-bottom: 2px;
-        }
 
-        .sidebar-subtitle {
-            color: #e8f4fd !important;
-            font-size: 18px !important;
-            text-align: center;
-            opacity: 0.9;
-            margin-bottom: 15px;
-        }
+def _is_pdf(name):
+    """判断文件名是否为PDF（只对后缀做小写转换，不复制整个文件名）"""
+    return name[-4:].lower() == '.pdf'
+
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def _list_pdfs(folder_path, mtime):
+    """列出文件夹中的PDF文件路径（mtime作为缓存键，目录内容变化时自动失效；计数也由此得出）"""
+    with os.scandir(folder_path) as it:
+        return [e.path for e in it if e.is_file() and _is_pdf(e.name)]
+
+
+def _folder_pdfs(folder_path):
+    """按目录当前修改时间获取缓存的PDF文件路径列表"""
+    return _list_pdfs(folder_path, os.stat(folder_path).st_mtime)
+
+
+@st.cache_data(ttl=5)
+def _list_categories(output_dir="output"):
+    """统计分类结果目录下各类别的文件数和总大小，返回 {类别: (文件数, 字节数)}"""
+    if not os.path.isdir(output_dir):
+        return {}
+    categories = {}
+    with os.scandir(output_dir) as it:
+        for entry in it:
+            if entry.is_dir():
+                file_count = total_bytes = 0
+                with os.scandir(entry.path) as files:
+                    for f in files:
+                        file_count += 1
+                        if f.is_file():
+                            total_bytes += f.stat().st_size
+                categories[entry.name] = (file_count, total_bytes)
+    return categories
+
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def _build_export_bytes(results_version, _results, columns):
+    """按结果版本缓存导出的Excel字节，结果不变时重复点击无需重新生成（_results 不参与哈希）"""
+    return ExportService.export_rows_to_excel(_results, columns).getvalue()
+
+
+# 会话状态默认值
+_DEFAULT_STATE = {
+    'logged_in': False,
+    'user_id': None,
+    'username': None,
+    'auth_token': None,
+    'token_expire_epoch': None,
+    'uploaded_files': [],
+    'current_results': [],
+    'success_count': 0,  # current_results 中状态为成功的数量，追加结果时递增
+    '_success_rate_str': "0.0%",  # 侧边栏成功率显示，结果变化时由 _touch_metrics 更新
+    'processing': False,
+    'paused': False,
+    'current_file_index': 0,
+    'file_paths': [],
+    'file_source': "upload",
+    'folder_path': "",
+    'executor': None,  # 批量提取使用的进程池
+    'process_workers': 1,
+    'pending_futures': deque(),  # 已提交、尚未收集的任务（按提交顺序）
+    'next_submit_index': 0,
+    'file_digests': [],  # 与 file_paths 对应的文件内容摘要
+    'results_df': None,  # current_results 对应的DataFrame缓存，只追加新增行
+    'results_version': None,  # current_results 每次变化时更新的唯一标识，用作导出缓存键
+}
+
+# 时间管理状态默认值（last_time_update 需取当前时间，单独初始化）
+_DEFAULT_TIME_STATE = {
+    'time_display': "计算中...",
+    'token_status': "🟢 有效",
+    'time_color': "#27ae60",
+    'last_manual_refresh': 0,
+    'auto_refresh_enabled': True,
+    'refresh_interval': 5,  # 默认5秒
+    'time_management_initialized': True,
+}
+
+
+def _apply_state_defaults(defaults):
+    """为缺失的会话状态键写入默认值（可变对象会复制，避免会话间共享）"""
+    for key, value in defaults.items():
+        if key not in st.session_state:
+            st.session_state[key] = copy.copy(value)
+
+
+@st.cache_resource
+def _zip_executor():
+    """后台打包分类ZIP的线程池（每个进程只创建一次，脚本重跑时复用）"""
+    return ThreadPoolExecutor(max_workers=2)
+
+# 超过该大小的类别不预先打包、也不在会话中常驻，点击下载时按需生成
+ZIP_PREBUILD_MAX_BYTES = 50 * 1024 * 1024
+# 每次分类后预先打包的类别总大小上限
+ZIP_PREBUILD_TOTAL_BYTES = 200 * 1024 * 1024
+
+# 写入ZIP条目时的拷贝块大小（ZipFile.write 固定为8KB）
+ZIP_COPY_CHUNK = 1 << 20
+
+# 侧边栏导航菜单
+_MENU_OPTIONS = {
+    "发票提取": {"icon": "📁", "desc": "批量提取发票信息"},
+    "结果查看": {"icon": "📊", "desc": "查看处理结果"},
+    "数据分析": {"icon": "📈", "desc": "数据可视化分析"},
+    "系统设置": {"icon": "⚙️", "desc": "系统配置管理"},
+    "使用帮助": {"icon": "❓", "desc": "使用说明文档"},
+    "分类管理": {"icon": "🗂️", "desc": "发票文件分类管理"},
+}
+_MENU_LABELS = {name: f"{opt['icon']} {name}" for name, opt in _MENU_OPTIONS.items()}
+_MENU_NAMES = list(_MENU_OPTIONS)
+
+# 上传文件写入磁盘时的拷贝块大小
+UPLOAD_COPY_CHUNK = 1 << 20
+
+# 批量提取：每个工作进程最多同时挂起的任务数，以及等待结果时的刷新间隔（秒）
+PROCESS_TASKS_PER_WORKER = 2
+PROCESS_POLL_INTERVAL = 0.5
+# 会话进程池超过该时间（秒）未提交任务即视为闲置（如会话已被关闭），由其他会话创建进程池时关闭
+PROCESS_POOL_IDLE_SECONDS = 30 * 60
+# 处理过程中每收集多少个结果刷新一次结果预览
+RESULTS_FLUSH_EVERY = 20
+
+# 结果表格的列顺序（未列出的列按原顺序排在后面）
+COLUMN_ORDER = (
+    '费用所属月份(审核月份)', '事业部', '大项目', '文件名', '姓名', '发票代码', '发票号码',
+    '开票日期', '金额', '税率', '税额', '价税合计', '状态',
+)
 
-        /* 主内容区域样式 */
-        .main-content {
-            padding: 40px;
-            background: linear-gradient(135deg, #1e3c72 0%, #2a5298 100%);
-            border-radius: 15px;
-            margin: 20px;
-            box-shadow: 0 8px 32px rgba(0,0,0,0.2);
-            color: white;
-            text-align: center;
-            min-height: 300px;
-            display: flex;
-            flex-direction: column;
-            justify-content: center;
-            align-items: center;
-        }
 
-        .main-title {
-            font-size: 36px;
-            font-weight: 800;
-            color: white;
-            margin-bottom: 20px;
-            text-shadow: 0 2px 10px rgba(0,0,0,0.3);
-            font-family: 'Microsoft YaHei', Arial, sans-serif;
-        }
+def _ordered_columns(columns):
+    """按 COLUMN_ORDER 排列列名"""
+    present = set(columns)
+    return [c for c in COLUMN_ORDER if c in present] + [c for c in columns if c not in COLUMN_ORDER]
 
-        .subtitle {
-            font-size: 18px;
-            color: rgba(255,255,255,0.9);
-            font-weight: 400;
-            line-height: 1.6;
-            max-width: 600px;
-            margin: 0 auto;
-            font-family: 'Microsoft YaHei', Arial, sans-serif;
-        }
 
-        /* 控制按钮样式 */
-        .control-buttons {
-            display: flex;
-            gap: 10px;
-            margin: 20px 0;
-        }
+# 提取结果缓存的最大条目数
+EXTRACTION_CACHE_MAX = 4096
 
-        .control-button {
-            padding: 10px 20px;
-            border-radius: 8px;
-            border: none;
-            font-weight: 600;
-            cursor: pointer;
-            transition: all 0.3s ease;
-        }
+# Token有效期（秒）
+TOKEN_EXPIRE_SECONDS = 24 * 3600
 
-        .primary-button {
-            background: #e74c3c;
-            color: white;
-        }
+@st.cache_resource
+def _get_services():
+    """创建后端服务实例（每个进程只创建一次）"""
+    db_manager = DatabaseManager()
+    extractor = InvoiceExtractor()
+    invoice_service = InvoiceService(db_manager, extractor)
+    return (
+        db_manager,
+        AuthService(db_manager),
+        extractor,
+        invoice_service,
+        InvoiceWriter(invoice_service),
+        SystemService(db_manager),
+        ExportService(),
+    )
 
-        .secondary-button {
-            background: #3498db;
-            color: white;
-        }
 
-        .warning-button {
-            background: #f39c12;
-            color: white;
-        }
+@st.cache_resource
+def _session_executors():
+    """各会话的进程池登记表：executor -> 最近一次提交任务的时间（跨会话共享，用于关闭闲置进程池）"""
+    return {}, threading.Lock()
 
-        .control-button:hover {
-            transform: translateY(-2px);
-            box-shadow: 0 4px 12px rgba(0,0,0,0.2);
-        }
 
-        /* 结果表格样式 */
-        .result-table {
-            background: white;
-            border-radius: 10px;
-            padding: 20px;
-            margin: 20px 0;
-            box-shadow: 0 2px 8px rgba(0,0,0,0.1);
-        }
-        
-        /* Token状态样式 */
-        .token-status {
-            background: rgba(255,255,255,0.1);
-            border-radius: 6px;
-            padding: 8px 12px;
-            margin: 5px 0;
-            border-left: 3px solid #2ecc71;
-        }
-        .token-expiring {
-            border-left-color: #f39c12;
-            background: rgba(243, 156, 18, 0.1);
-        }
-        .token-expired {
-            border-left-color: #e74c3c;
-            background: rgba(231, 76, 60, 0.1);
-        }
-        .token-time {
-            font-size: 12px;
-            opacity: 0.8;
-            margin-top: 2px;
-        }
-        /* 分类页面样式 */
-        .classification-section {
-            margin-top: 30px;
-        }
+def _touch_executor(executor):
+    """登记进程池的最近活动时间；已被关闭回收的进程池返回 False"""
+    executors, lock = _session_executors()
+    with lock:
+        if executor not in executors:
+            return False
+        executors[executor] = time.monotonic()
+    return True
 
-        .category-list {
-            margin-top: 20px;
-        }
 
-        .category-item {
-            margin-bottom: 10px;
-        }
+def _reap_idle_executors():
+    """关闭长时间闲置的会话进程池（会话关闭后其进程池不会再被使用）"""
+    executors, lock = _session_executors()
+    deadline = time.monotonic() - PROCESS_POOL_IDLE_SECONDS
+    with lock:
+        idle = [executor for executor, last_used in executors.items() if last_used < deadline]
+        for executor in idle:
+            del executors[executor]
+    for executor in idle:
+        executor.shutdown(wait=False, cancel_futures=True)
 
-        .download-button {
-            margin-right: 10px;
-        }
-    </style>
-    """, unsafe_allow_html=True)
 
+@st.cache_resource
+def _extraction_cache():
+    """提取结果缓存：文件内容摘要 -> 提取结果（跨会话、跨重跑共享）"""
+    return {}
+
+
+# 进程级已验证Token缓存的最大条数
+VERIFIED_TOKENS_MAX = 256
+
+
+@st.cache_resource
+def _verified_tokens():
+    """已验证Token缓存：blake2b(token) -> (user_id, username, exp)（跨会话共享，如刷新页面从URL恢复登录）"""
+    return {}, threading.Lock()
 
-apply_custom_styles()
+
+def _token_key(token: str) -> bytes:
+    """计算Token的缓存键"""
+    return hashlib.blake2b(token.encode(), digest_size=16).digest()
+
+
+def _verify_token_cached(auth_service, token: str) -> Optional[dict]:
+    """验证Token，本会话或本进程已验证过同一Token且未过期时直接返回缓存的payload，跳过JWT解码"""
+    now = time.time()
+    cached = st.session_state.get('_token_payload')
+    if cached and cached['token'] == token and cached['exp'] > now:
+        return cached['data']
+
+    verified, lock = _verified_tokens()
+    key = _token_key(token)
+    entry = verified.get(key)
+    if entry and entry[2] > now:
+        payload = {'user_id': entry[0], 'username': entry[1], 'exp': entry[2]}
+    else:
+        payload = auth_service.verify_token(token)
+        with lock:
+            if not payload:
+                verified.pop(key, None)
+            else:
+                if len(verified) >= VERIFIED_TOKENS_MAX:
+                    # 先清理过期项，仍然满则全部清空
+                    for k in [k for k, v in verified.items() if v[2] <= now]:
+                        del verified[k]
+                    if len(verified) >= VERIFIED_TOKENS_MAX:
+                        verified.clear()
+                verified[key] = (payload.get('user_id'), payload.get('username'), payload.get('exp', 0))
+
+    if not payload:
+        st.session_state.pop('_token_payload', None)
+        return None
+    st.session_state['_token_payload'] = {'token': token, 'exp': payload.get('exp', 0), 'data': payload}
+    return payload
+
+
+def _forget_token(token: Optional[str]):
+    """退出登录时清除Token验证缓存（本会话及进程级），之后同一Token需要重新验签"""
+    st.session_state.pop('_token_payload', None)
+    if token:
+        verified, lock = _verified_tokens()
+        with lock:
+            verified.pop(_token_key(token), None)
 
 
 class FrontendApp:
     """前端应用类 - 支持中断处理和状态保持"""
 
     def __init__(self):
-        self.db_manager = DatabaseManager()
-        self.auth_service = AuthService(self.db_manager)
-        self.extractor = InvoiceExtractor()
-        self.invoice_service = InvoiceService(self.db_manager, self.extractor)
-        self.system_service = SystemService(self.db_manager)
-        self.export_service = ExportService()
+        (self.db_manager, self.auth_service, self.extractor, self.invoice_service,
+         self.invoice_writer, self.system_service, self.export_service) = _get_services()
+        self._params = st.query_params.to_dict()  # 每次运行只读取一次URL参数
+        self._time_placeholder = None  # Token时间显示占位符
         self._init_token_from_url()  # 从URL初始化Token
         self._init_session_state()  # 初始化会话状态
         self._init_time_management_state()  # 初始化时间管理状态
@@ -215,9 +327,9 @@ class FrontendApp:
 
         if folder_path:
             if os.path.exists(folder_path):
-                pdf_files = [f for f in os.listdir(folder_path) if f.lower().endswith('.pdf')]
-                if pdf_files:
-                    st.success(f"✅ 找到 {len(pdf_files)} 个PDF文件")
+                pdf_count = len(_folder_pdfs(folder_path))
+                if pdf_count:
+                    st.success(f"✅ 找到 {pdf_count} 个PDF文件")
                 else:
                     st.warning("⚠️ 文件夹中没有找到PDF文件")
             else:
@@ -240,8 +352,21 @@ class FrontendApp:
             st.info("🔄 正在分类文件，请稍候...")
 
             try:
-                temp_output = classify_pdfs(folder_path)
-                move_to_output(temp_output)
+                # 直接分类到output目录，无需再从临时文件夹移动
+                classify_pdfs_parallel(folder_path, "output")
+                # 文件已移动，清除分类结果缓存（源文件夹的PDF列表随目录mtime自动失效）
+                _list_categories.clear()
+                st.session_state.classification_dirty = True
+                # 分类完成后立即在后台预先打包各类别ZIP（单个及总大小都有上限）
+                zip_futures = {}
+                budget = ZIP_PREBUILD_TOTAL_BYTES
+                for category, (_, total_bytes) in _list_categories().items():
+                    if total_bytes <= min(ZIP_PREBUILD_MAX_BYTES, budget):
+                        budget -= total_bytes
+                        zip_futures[category] = _zip_executor().submit(
+                            self._create_zip, os.path.join("output", category))
+                st.session_state['_zip_futures'] = zip_futures
+                st.session_state.pop('_zip_requested', None)
                 self.system_service.log_operation(
                     st.session_state.user_id, "分类完成", f"成功对文件夹 '{folder_path}' 中的发票进行分类"
                 )
@@ -252,98 +377,150 @@ class FrontendApp:
                 )
                 st.error(f"❌ 分类过程中出现错误: {str(e)}")
 
-        # 显示分类结果（可选）
-        if os.path.exists("output"):
+        # 显示分类结果（可选），只在分类完成后或首次进入时重新扫描output目录
+        if st.session_state.get('classification_dirty') or '_cached_categories' not in st.session_state:
+            st.session_state['_cached_categories'] = _list_categories() if os.path.isdir("output") else None
+            st.session_state.classification_dirty = False
+        categories = st.session_state['_cached_categories']
+        if categories is not None:
             st.subheader("📊 分类结果概览")
-            categories = os.listdir("output")
             if categories:
-                for category in categories:
-                    files = os.listdir(os.path.join("output", category))
-                    st.markdown(f"#### {category} ({len(files)} 个文件)")
+                zip_futures = st.session_state.setdefault('_zip_futures', {})
+                # 只为用户选择的类别生成下载按钮，避免每次重跑都把所有ZIP交给前端
+                # 点击在回调中记录，循环开始前即已确定本次要下载的类别
+                requested = st.session_state.get('_zip_requested')
+                for category, (file_count, total_bytes) in categories.items():
+                    st.markdown(f"#### {category} ({file_count} 个文件)")
                     # 提供下载链接
                     zip_filename = f"{category}.zip"
-                    if st.button(f"📥 下载 {category} 分类结果", key=f"download_{category}"):
-                        self._create_zip(os.path.join("output", category), zip_filename)
-                        st.download_button(
-                            label=f"下载 {category} 分类结果",
-                            data=open(zip_filename, "rb").read(),
-                            file_name=zip_filename,
-                            mime="application/zip"
-                        )
-                        # 删除生成的ZIP文件
-                        os.remove(zip_filename)
+                    st.button(f"📥 下载 {category} 分类结果", key=f"download_{category}",
+                              on_click=self._request_zip, args=(category,))
+                    if category != requested:
+                        continue
+
+                    future = zip_futures.get(category)
+                    if future is None:
+                        future = _zip_executor().submit(self._create_zip, os.path.join("output", category))
+                        zip_futures[category] = future
+                    try:
+                        with st.spinner(f"正在打包 {category}..."):
+                            zip_data = future.result()
+                    except Exception as e:
+                        # 打包失败，丢弃结果以便重新打包
+                        logger.error(f"打包 {category} 失败: {e}")
+                        zip_futures.pop(category, None)
+                        st.session_state.pop('_zip_requested', None)
+                        st.error(f"❌ 打包 {category} 失败: {str(e)}")
+                        continue
+                    finally:
+                        # 大类别的ZIP只用于本次下载，不在会话中保留，下次重跑也不再重新打包
+                        if total_bytes > ZIP_PREBUILD_MAX_BYTES:
+                            zip_futures.pop(category, None)
+                            st.session_state.pop('_zip_requested', None)
+
+                    st.download_button(
+                        label=f"下载 {category} 分类结果",
+                        data=zip_data,
+                        file_name=zip_filename,
+                        mime="application/zip",
+                        key=f"zip_{category}"
+                    )
             else:
                 st.info("📁 'output' 文件夹中暂无分类结果。")
 
-    def _create_zip(self, source_dir, output_filename):
-        """创建ZIP文件"""
-        with zipfile.ZipFile(output_filename, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for root, dirs, files in os.walk(source_dir):
-                for file in files:
-                    zipf.write(os.path.join(root, file),
-                               os.path.relpath(os.path.join(root, file),
-                                               os.path.join(source_dir, '..')))
-        print(f"ZIP文件 '{output_filename}' 创建成功。")
+    @staticmethod
+    def _request_zip(category):
+        """下载按钮回调：记录用户要下载的类别"""
+        st.session_state['_zip_requested'] = category
+
+    def _create_zip(self, source_dir) -> bytes:
+        """在内存中创建ZIP文件并返回其字节内容"""
+        source_dir = os.path.normpath(source_dir)
+        # 归档名以类别文件夹开头，直接按前缀长度切片，无需relpath
+        parent = os.path.dirname(source_dir)
+        prefix_len = len(parent) + 1 if parent else 0
+
+        buf = BytesIO()
+        with zipfile.ZipFile(buf, 'w', zipfile.ZIP_DEFLATED, compresslevel=1,
+                             strict_timestamps=False) as zipf:
+            stack = [source_dir]
+            while stack:
+                with os.scandir(stack.pop()) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.is_file():
+                            arcname = entry.path[prefix_len:]
+                            if _is_pdf(entry.name):
+                                # PDF内部已压缩，直接存储避免重复DEFLATE，并按大块拷贝
+                                zinfo = zipfile.ZipInfo.from_file(entry.path, arcname, strict_timestamps=False)
+                                zinfo.compress_type = zipfile.ZIP_STORED
+                                with open(entry.path, 'rb') as src, zipf.open(zinfo, 'w') as dest:
+                                    shutil.copyfileobj(src, dest, ZIP_COPY_CHUNK)
+                            else:
+                                zipf.write(entry.path, arcname)
+        return buf.getvalue()
 
     def _init_time_management_state(self):
         """修复版本：初始化时间管理状态"""
         # 确保所有必要的状态都存在
         if 'last_time_update' not in st.session_state:
             st.session_state.last_time_update = time.time()
-        if 'time_display' not in st.session_state:
-            st.session_state.time_display = "计算中..."
-        if 'token_status' not in st.session_state:
-            st.session_state.token_status = "🟢 有效"
-        if 'time_color' not in st.session_state:
-            st.session_state.time_color = "#27ae60"
-        if 'last_manual_refresh' not in st.session_state:
-            st.session_state.last_manual_refresh = 0
-        if 'auto_refresh_enabled' not in st.session_state:
-            st.session_state.auto_refresh_enabled = True
-        if 'refresh_interval' not in st.session_state:
-            st.session_state.refresh_interval = 5  # 默认5秒
-        if 'time_management_initialized' not in st.session_state:
-            st.session_state.time_management_initialized = True
+        _apply_state_defaults(_DEFAULT_TIME_STATE)
 
     def _calculate_time_display(self):
         """计算并更新时间显示"""
-        expire_time_str = st.session_state.get('token_expire_time')
-        if not expire_time_str:
+        expire_epoch = st.session_state.get('token_expire_epoch')
+        if not expire_epoch:
+            self._reset_time_cache()
             st.session_state.time_display = "未知"
             st.session_state.token_status = "🔴 错误"
             st.session_state.time_color = "#e74c3c"
             return
 
         try:
-            expire_time = datetime.datetime.fromisoformat(expire_time_str)
-            now = datetime.datetime.now()
-            time_left = expire_time - now
+            time_left = int(expire_epoch - time.time())
 
-            if time_left.total_seconds() <= 0:
+            if time_left <= 0:
+                self._reset_time_cache()
                 st.session_state.time_display = "00:00:00"
                 st.session_state.token_status = "🔴 已过期"
                 st.session_state.time_color = "#e74c3c"
                 return
 
-            hours = int(time_left.total_seconds() // 3600)
-            minutes = int((time_left.total_seconds() % 3600) // 60)
-            seconds = int(time_left.total_seconds() % 60)
+            # 秒数未变化时无需重写显示状态
+            if time_left == st.session_state.get('_last_time_left_int'):
+                return
+            st.session_state['_last_time_left_int'] = time_left
+
+            hours, rem = divmod(time_left, 3600)
+            minutes, seconds = divmod(rem, 60)
 
             st.session_state.time_display = f"{hours:02d}:{minutes:02d}:{seconds:02d}"
 
-            if hours < 1:
-                st.session_state.token_status = "🟠 即将过期"
-                st.session_state.time_color = "#f39c12"
-            else:
-                st.session_state.token_status = "🟢 有效"
-                st.session_state.time_color = "#27ae60"
+            # 只在状态区间（<1小时 / >=1小时）切换时更新状态和颜色
+            expiring = hours < 1
+            if expiring != st.session_state.get('_last_time_expiring'):
+                st.session_state['_last_time_expiring'] = expiring
+                if expiring:
+                    st.session_state.token_status = "🟠 即将过期"
+                    st.session_state.time_color = "#f39c12"
+                else:
+                    st.session_state.token_status = "🟢 有效"
+                    st.session_state.time_color = "#27ae60"
 
         except Exception as e:
             logger.error(f"时间计算错误: {e}")
+            self._reset_time_cache()
             st.session_state.time_display = "计算错误"
             st.session_state.token_status = "🔴 错误"
             st.session_state.time_color = "#e74c3c"
 
+    def _reset_time_cache(self):
+        """清除时间显示缓存，确保下次计算时完整更新"""
+        st.session_state['_last_time_left_int'] = None
+        st.session_state['_last_time_expiring'] = None
+
     def _should_update_time(self):
         """判断是否需要更新时间"""
         if not st.session_state.get('auto_refresh_enabled', True):
@@ -363,6 +540,21 @@ class FrontendApp:
 
     def _render_token_display(self):
         """渲染Token显示区域"""
+        # Token信息写入独立占位符，手动刷新时只更新该区域
+        self._time_placeholder = st.empty()
+        self._render_token_block()
+
+        # 手动刷新按钮
+        col1, col2 = st.columns([3, 1])
+        with col2:
+            if st.button("↻", key="mini_refresh", help="快速刷新时间显示"):
+                self._manual_refresh_time()
+
+    def _render_token_block(self):
+        """将Token状态和剩余时间写入占位符"""
+        if self._time_placeholder is None:
+            return
+
         # 从Session State获取数据
         time_display = st.session_state.get('time_display', '计算中...')
         token_status = st.session_state.get('token_status', '有效')
@@ -376,7 +568,7 @@ class FrontendApp:
         else:  # 过期或其他状态
             status_color = "#e74c3c"
 
-        st.markdown(f"""
+        self._time_placeholder.markdown(f"""
            <div style="
                background: rgba(255,255,255,0.1); 
                border-radius: 10px; 
@@ -416,24 +608,16 @@ class FrontendApp:
            </div>
            """, unsafe_allow_html=True)
 
-        # 手动刷新按钮
-        col1, col2 = st.columns([3, 1])
-        with col2:
-            if st.button("↻", key="mini_refresh", help="快速刷新时间显示"):
-                self._manual_refresh_time()
-
     def _init_token_from_url(self):
         """从URL参数初始化Token"""
         # 获取URL中的token参数
-        params = st.query_params.to_dict()
-        token = params.get('token')
+        token = self._params.get('token')
 
         if token and 'auth_token' not in st.session_state:
             # 将URL中的Token保存到session state
             st.session_state.auth_token = token
             # 设置默认过期时间（24小时后）
-            expire_time = datetime.datetime.now() + datetime.timedelta(hours=24)
-            st.session_state.token_expire_time = expire_time.isoformat()
+            st.session_state.token_expire_epoch = time.time() + TOKEN_EXPIRE_SECONDS
 
             # 立即验证Token
             if self._check_token_validity():
@@ -442,38 +626,13 @@ class FrontendApp:
     def _init_session_state(self):
         """初始化会话状态- 修复Token持久化"""
         # 从URL参数获取Token（防止刷新丢失）
-        params = st.query_params.to_dict()
+        params = self._params
         if 'token' in params and 'auth_token' not in st.session_state:
             st.session_state.auth_token = params['token']
         # 检查Token有效性
         if 'auth_token' in st.session_state and not st.session_state.get('logged_in'):
             self._check_token_validity()
-        if 'logged_in' not in st.session_state:
-            st.session_state.logged_in = False
-        if 'user_id' not in st.session_state:
-            st.session_state.user_id = None
-        if 'username' not in st.session_state:
-            st.session_state.username = None
-        if 'auth_token' not in st.session_state:
-            st.session_state.auth_token = None
-        if 'token_expire_time' not in st.session_state:
-            st.session_state.token_expire_time = None
-        if 'uploaded_files' not in st.session_state:
-            st.session_state.uploaded_files = []
-        if 'current_results' not in st.session_state:
-            st.session_state.current_results = []
-        if 'processing' not in st.session_state:
-            st.session_state.processing = False
-        if 'paused' not in st.session_state:
-            st.session_state.paused = False
-        if 'current_file_index' not in st.session_state:
-            st.session_state.current_file_index = 0
-        if 'file_paths' not in st.session_state:
-            st.session_state.file_paths = []
-        if 'file_source' not in st.session_state:
-            st.session_state.file_source = "upload"
-        if 'folder_path' not in st.session_state:
-            st.session_state.folder_path = ""
+        _apply_state_defaults(_DEFAULT_STATE)
 
     def add_enhanced_time_management(self):
         """增强的时间管理功能"""
@@ -508,7 +667,8 @@ class FrontendApp:
 
                 # 时间详情展开面板
                 with st.expander("📊 时间详情", expanded=False):
-                    expire_time = st.session_state.get('token_expire_time', '未知')
+                    expire_epoch = st.session_state.get('token_expire_epoch')
+                    expire_time = datetime.datetime.fromtimestamp(expire_epoch).isoformat() if expire_epoch else '未知'
                     current_display = st.session_state.get('time_display', '计算中...')
 
                     st.write(f"**Token过期时间:** {expire_time}")
@@ -550,29 +710,30 @@ class FrontendApp:
             return False
 
         try:
-            # 验证Token
-            payload = self.auth_service.verify_token(token)
+            # 验证Token（本会话命中缓存时跳过JWT解码）
+            payload = _verify_token_cached(self.auth_service, token)
             if not payload:
                 return False
+            user_id, username = payload.get('user_id'), payload.get('username')
 
             # 检查过期时间
-            if 'token_expire_time' not in st.session_state:
+            expire_epoch = st.session_state.get('token_expire_epoch')
+            if not expire_epoch:
                 # 如果没有过期时间，设置一个默认值
-                expire_time = datetime.datetime.now() + datetime.timedelta(hours=24)
-                st.session_state.token_expire_time = expire_time.isoformat()
-            else:
-                expire_time = datetime.datetime.fromisoformat(st.session_state.token_expire_time)
-                if datetime.datetime.now() > expire_time:
-                    return False
+                st.session_state.token_expire_epoch = time.time() + TOKEN_EXPIRE_SECONDS
+            elif time.time() > expire_epoch:
+                return False
 
             # 更新用户信息
-            st.session_state.user_id = payload.get('user_id')
-            st.session_state.username = payload.get('username')
+            st.session_state.user_id = user_id
+            st.session_state.username = username
             st.session_state.logged_in = True
 
-            #  # 确保URL中包含Token（防止刷新丢失）
-            if st.query_params.get("token") != token:
-                st.query_params["token"] = token
+            #  # 确保URL中包含Token（防止刷新丢失），写入一次后不再重复写
+            if not st.session_state.get('_token_in_url'):
+                if self._params.get("token") != token:
+                    st.query_params["token"] = token
+                st.session_state['_token_in_url'] = True
 
             logger.info(f"✅ Token验证成功，用户: {st.session_state.username}")
             return True
@@ -583,58 +744,69 @@ class FrontendApp:
 
     def _clear_auth_data(self):
         """清除认证数据 - 同时清除查询参数"""
+        _forget_token(st.session_state.get('auth_token'))
+
         # 清除session state
         st.session_state.logged_in = False
         st.session_state.user_id = None
         st.session_state.username = None
         st.session_state.auth_token = None
-        st.session_state.token_expire_time = None
+        st.session_state.token_expire_epoch = None
 
         # 关键修复：清除URL中的Token参数
         if "token" in st.query_params:
             del st.query_params["token"]
+        st.session_state['_token_in_url'] = False
 
         logger.info("✅ 认证数据已清除")
 
     def _save_auth_data(self, user: User, token: str):
         """保存认证数据"""
-        expire_time = datetime.datetime.now() + datetime.timedelta(hours=24)
+        expire_epoch = time.time() + TOKEN_EXPIRE_SECONDS
 
         st.session_state.logged_in = True
         st.session_state.user_id = user.id
         st.session_state.username = user.username
         st.session_state.auth_token = token
-        st.session_state.token_expire_time = expire_time.isoformat()
+        st.session_state.token_expire_epoch = expire_epoch
 
         # 关键修复：将Token保存到URL参数
         st.query_params["token"] = token
+        st.session_state['_token_in_url'] = True
 
         logger.info(f"✅ 认证数据已保存，用户: {user.username}")
-        logger.info(f"Token生成成功，过期时间: {expire_time.strftime('%Y-%m-%d %H:%M:%S')}")
+        logger.info(f"Token生成成功，过期时间: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(expire_epoch))}")
 
     def _auto_refresh_token(self):
         """自动刷新Token"""
         if not st.session_state.get('auth_token'):
             return
 
+        # 距上次检查不足60秒时直接返回
+        now = time.time()
+        if now < st.session_state.get('_next_refresh_check_epoch', 0):
+            return
+
         # 检查Token剩余时间
-        if st.session_state.get('token_expire_time'):
-            expire_time = datetime.datetime.fromisoformat(st.session_state.token_expire_time)
-            time_left = expire_time - datetime.datetime.now()
+        expire_epoch = st.session_state.get('token_expire_epoch')
+        if expire_epoch:
+            time_left = expire_epoch - now
 
             # 如果剩余时间少于30分钟，自动刷新
-            if time_left.total_seconds() < 1800:
+            if time_left >= 1800:
+                st.session_state['_next_refresh_check_epoch'] = now + 60
+            else:
                 try:
                     # 生成新Token
                     new_token = self.auth_service.generate_token(
                         st.session_state.user_id,
                         st.session_state.username
                     )
-                    new_expire_time = datetime.datetime.now() + datetime.timedelta(hours=24)
+                    new_expire_epoch = time.time() + TOKEN_EXPIRE_SECONDS
 
                     # 更新Token
                     st.session_state.auth_token = new_token
-                    st.session_state.token_expire_time = new_expire_time.isoformat()
+                    st.session_state.token_expire_epoch = new_expire_epoch
                     st.experimental_set_query_params(token=new_token)
 
                     # 记录刷新日志
@@ -645,7 +817,7 @@ class FrontendApp:
                     )
 
                     st.toast("🔐 Token已自动刷新", icon="✅")
-                    logger.info(f"Token自动刷新，新过期时间: {new_expire_time.strftime('%H:%M:%S')}")
+                    logger.info(f"Token自动刷新，新过期时间: {time.strftime('%H:%M:%S', time.localtime(new_expire_epoch))}")
 
                 except Exception as e:
                     logger.error(f"Token自动刷新失败: {e}")
@@ -725,26 +897,17 @@ class FrontendApp:
             # 功能选择区域
             st.markdown("### 📋 选择功能")
 
-            menu_options = {
-                "发票提取": {"icon": "📁", "desc": "批量提取发票信息"},
-                "结果查看": {"icon": "📊", "desc": "查看处理结果"},
-                "数据分析": {"icon": "📈", "desc": "数据可视化分析"},
-                "系统设置": {"icon": "⚙️", "desc": "系统配置管理"},
-                "使用帮助": {"icon": "❓", "desc": "使用说明文档"},
-                "分类管理": {"icon": "🗂️", "desc": "发票文件分类管理"},
-            }
-
             selected = st.radio(
                 "导航菜单",
-                options=list(menu_options.keys()),
-                format_func=lambda x: f"{menu_options[x]['icon']} {x}",
+                options=_MENU_NAMES,
+                format_func=_MENU_LABELS.__getitem__,
                 label_visibility="collapsed"
             )
 
             # 功能描述
             st.markdown(f"""
             <div class="function-desc">
-                <div class="desc-text">{menu_options[selected]['desc']}</div>
+                <div class="desc-text">{_MENU_OPTIONS[selected]['desc']}</div>
             </div>
             """, unsafe_allow_html=True)
 
@@ -756,10 +919,7 @@ class FrontendApp:
             with col1:
                 st.metric("处理文件", len(st.session_state.current_results))
             with col2:
-                success_count = len([r for r in st.session_state.current_results if r.get('状态') == '成功'])
-                total_count = len(st.session_state.current_results)
-                success_rate = (success_count / total_count * 100) if total_count > 0 else 0
-                st.metric("成功率", f"{success_rate:.1f}%")
+                st.metric("成功率", st.session_state['_success_rate_str'])
 
             st.markdown("---")
             # 退出登录按钮 -  清除Token
@@ -776,10 +936,10 @@ class FrontendApp:
             return selected
 
     def _manual_refresh_time(self):
-        """手动刷新时间"""
+        """手动刷新时间（只重绘时间占位符，不触发整页rerun）"""
         self._calculate_time_display()
         st.session_state.last_time_update = time.time()
-        st.rerun()
+        self._render_token_block()
 
     def _update_time_status_only(self):
         """只更新时间状态，不刷新页面"""
@@ -876,12 +1036,22 @@ class FrontendApp:
     def _clear_results(self):
         """清除当前结果"""
         st.session_state.current_results = []
+        st.session_state.results_df = None
+        st.session_state.success_count = 0
+        self._touch_metrics()
         st.session_state.file_paths = []
         st.session_state.current_file_index = 0
         st.session_state.uploaded_files = []
         st.session_state.folder_path = ""
         st.success("✅ 结果已清除，可以重新开始")
 
+    def _touch_metrics(self):
+        """结果变化后更新结果版本和缓存的成功率字符串"""
+        st.session_state.results_version = uuid.uuid4().hex
+        total_count = len(st.session_state.current_results)
+        success_rate = (st.session_state.success_count / total_count * 100) if total_count > 0 else 0
+        st.session_state['_success_rate_str'] = f"{success_rate:.1f}%"
+
     def _start_processing(self):
         """开始处理"""
         if st.session_state.file_source == "upload" and not st.session_state.uploaded_files:
@@ -899,16 +1069,15 @@ class FrontendApp:
             file_paths = []
             for uploaded_file in st.session_state.uploaded_files:
                 file_path = os.path.join(temp_dir, uploaded_file.name)
-                with open(file_path, "wb") as f:
-                    f.write(uploaded_file.getbuffer())
+                # 按1MB分块写入（同样大小的写缓冲），避免一次性复制整个文件内容
+                uploaded_file.seek(0)
+                with open(file_path, "wb", buffering=UPLOAD_COPY_CHUNK) as f:
+                    shutil.copyfileobj(uploaded_file, f, length=UPLOAD_COPY_CHUNK)
                 file_paths.append(file_path)
         else:
             # 处理文件夹中的文件
             folder_path = st.session_state.folder_path
-            file_paths = []
-            for file in os.listdir(folder_path):
-                if file.lower().endswith('.pdf'):
-                    file_paths.append(os.path.join(folder_path, file))
+            file_paths = _folder_pdfs(folder_path)
 
         if not file_paths:
             st.warning("⚠️ 没有找到可处理的PDF文件")
@@ -918,6 +1087,9 @@ class FrontendApp:
         st.session_state.file_paths = file_paths
         st.session_state.current_file_index = 0
         st.session_state.current_results = []  # 清空之前的结果
+        st.session_state.results_df = None
+        st.session_state.success_count = 0
+        self._touch_metrics()
         st.session_state.processing = True
         st.session_state.paused = False
 
@@ -941,9 +1113,82 @@ class FrontendApp:
         logger.info(
             f"用户选择 - 事业部：{selected_bu}, 大项目：{selected_project}, 年份：{selected_year}, 月份：{selected_month}")
 
+        # 提交到后台进程池并行处理，页面只负责收集结果
+        st.session_state.process_workers = min(8, os.cpu_count() or 1, len(file_paths))
+        self._start_executor(0)
+        self._submit_pending_files()
+
         # 显示文件统计信息
         st.success(f"🎯 开始处理 {len(file_paths)} 个文件...")
 
+    def _start_executor(self, start_index):
+        """创建本会话的进程池，从第 start_index 个文件开始提交"""
+        self._shutdown_executor()
+        _reap_idle_executors()
+        executor = ProcessPoolExecutor(max_workers=st.session_state.process_workers)
+        executors, lock = _session_executors()
+        with lock:
+            executors[executor] = time.monotonic()
+        st.session_state.executor = executor
+        st.session_state.pending_futures = deque()
+        st.session_state.next_submit_index = start_index
+        st.session_state.file_digests = st.session_state.file_digests[:start_index]
+
+    def _submit_pending_files(self):
+        """向进程池补充提交任务（暂停时不再提交新任务）"""
+        executor = st.session_state.get('executor')
+        if executor is None or st.session_state.paused:
+            return
+        if not _touch_executor(executor):
+            # 暂停过久，进程池已作为闲置进程池被关闭：从未收集结果的文件开始重新提交
+            self._start_executor(st.session_state.current_file_index)
+            executor = st.session_state.executor
+        pending = st.session_state.pending_futures
+        file_paths = st.session_state.file_paths
+        digests = st.session_state.file_digests
+        cache = _extraction_cache()
+        window = st.session_state.process_workers * PROCESS_TASKS_PER_WORKER
+        broken = False
+        while not broken and len(pending) < window and st.session_state.next_submit_index < len(file_paths):
+            file_path = file_paths[st.session_state.next_submit_index]
+            try:
+                digest = file_digest(file_path)
+            except OSError:
+                digest = None
+            cached = cache.get(digest) if digest else None
+            if cached is not None:
+                # 内容相同的文件已提取过：直接复用结果，只更新与文件名相关的字段
+                future = Future()
+                result = dict(cached)
+                result['文件名'] = os.path.basename(file_path)
+                result['姓名'] = self.extractor.extract_person_name(result['文件名'])
+                result['提取时间'] = datetime.datetime.now().strftime('%Y/%m/%d %H:%M:%S')
+                future.set_result(result)
+            else:
+                try:
+                    future = executor.submit(extract_invoice_worker, file_path)
+                except BrokenProcessPool as e:
+                    # 进程池已损坏：交给 _drain_completed 按顺序收集时统一处理
+                    future = Future()
+                    future.set_exception(e)
+                    broken = True
+            pending.append(future)
+            digests.append(digest)
+            st.session_state.next_submit_index += 1
+
+    def _shutdown_executor(self):
+        """取消未开始的任务并关闭进程池"""
+        for future in st.session_state.get('pending_futures') or ():
+            future.cancel()
+        st.session_state.pending_futures = deque()
+        executor = st.session_state.get('executor')
+        if executor is not None:
+            executors, lock = _session_executors()
+            with lock:
+                executors.pop(executor, None)
+            executor.shutdown(wait=False, cancel_futures=True)
+            st.session_state.executor = None
+
     def _pause_processing(self):
         """暂停处理"""
         st.session_state.paused = True
@@ -956,206 +1201,159 @@ class FrontendApp:
         """停止处理"""
         st.session_state.processing = False
         st.session_state.paused = False
+        self._shutdown_executor()
+        self.invoice_writer.flush()
         st.warning("⏹️ 处理已停止")
 
     def _show_processing_progress(self):
-        """显示处理进度 - 修复完成判断逻辑"""
+        """显示处理进度 - 在本次运行内持续收集结果，原地更新进度，处理期间不触发rerun"""
         st.markdown("### 🔄 处理进度")
 
-        if st.session_state.file_paths:
-            total_files = len(st.session_state.file_paths)
-            current_index = st.session_state.current_file_index
-            progress = current_index / total_files if total_files > 0 else 0
-
-            # 进度条
-            progress_bar = st.progress(progress)
-
-            # 状态信息
-            col1, col2, col3 = st.columns(3)
-            with col1:
-                st.metric("总文件数", total_files)
-            with col2:
-                st.metric("已处理", current_index)
-            with col3:
-                st.metric("进度", f"{progress:.1%}")
-
-            # 自动处理下一个文件（如果未暂停且未完成）
-            if (not st.session_state.paused and
-                    st.session_state.current_file_index < total_files):
-                self._process_next_file()
-
-    def _process_next_file(self):
-        """处理下一个文件 - 处理单个文件逻辑"""
-        if st.session_state.current_file_index >= len(st.session_state.file_paths):
-            return
-        file_path = st.session_state.file_paths[st.session_state.current_file_index]
-        try:
-            # 1. 处理发票文件 先调用提取器提取发票上的基本信息（自动从PDF提取）
-            basic_result = self.extractor.extract_invoice_info(file_path)
-            basic_result['姓名'] = self.extractor.extract_person_name(os.path.basename(file_path))
-            # 2. ✅ 从 session_state 获取用户手动选择的值
-            user_options = st.session_state.get("user_selected_options", {})
-            selected_bu = user_options.get("事业部", "未选择事业部")
-            selected_project = user_options.get("大项目", "未选择大项目")
-            selected_audit_month = user_options.get("费用所属月份(审核月份)", "未选择月份")
-
-            # 3. 关键：将这些用户选择的值，手动添加到 result 字典中
-            basic_result['事业部'] = selected_bu
-            basic_result['大项目'] = selected_project
-            basic_result['费用所属月份(审核月份)'] = selected_audit_month
-
-            # 4. 保存到数据库（直接调用 _save_to_database，传入 user_id）
-            if basic_result.get('状态') == '成功':
-                self.invoice_service._save_to_database(basic_result, st.session_state.user_id)
-
-            #  5. 添加到当前结果列表（用于前端展示）
-            st.session_state.current_results.append(basic_result)
-
-            # 更新进度
-            st.session_state.current_file_index += 1
-            # 只有当处理完所有文件时才标记完成
-            if st.session_state.current_file_index >= len(st.session_state.file_paths):
-                st.session_state.processing = False
-                st.balloons()
-                # 记录完成日志
-                success_count = len([r for r in st.session_state.current_results if r.get('状态') == '成功'])
-                self.system_service.log_operation(
-                    st.session_state.user_id,
-                    "批量处理完成",
-                    f"成功处理 {success_count}/{len(st.session_state.file_paths)} 个文件"
-                )
-            # 刷新界面
-            st.rerun()
-        except Exception as e:
-            st.error(f"❌ 处理文件失败: {os.path.basename(file_path)} - {str(e)}")
-            st.session_state.current_file_index += 1
-
-    def _show_current_results_advanced(self):
-        """显示当前处理结果 - 高级分页版本"""
-        st.markdown("### 📋 当前处理结果")
-
-        if not st.session_state.current_results:
-            st.info("💡 暂无处理结果")
+        if not st.session_state.file_paths:
             return
 
-        # 控制面板
-        col1, col2, col3, col4 = st.columns([2, 1, 1, 1])
+        total_files = len(st.session_state.file_paths)
 
+        # 进度条、状态信息和结果预览都使用占位符原地更新
+        progress_bar = st.progress(0.0)
+        col1, col2, col3 = st.columns(3)
         with col1:
-            st.markdown(f"**📊 数据统计：共 {len(st.session_state.current_results)} 条记录**")
-
+            st.metric("总文件数", total_files)
         with col2:
-            items_per_page = st.selectbox(
-                "每页显示",
-                [10, 20, 50, 100],
-                index=1,  # 默认20条
-                key="page_size"
-            )
-
+            processed_metric = st.empty()
         with col3:
-            if st.button("🗑️ 清除结果", type="secondary", use_container_width=True):
-                self._clear_results()
-                st.rerun()
-
-        with col4:
-            if st.button("📥 导出全部", type="primary", use_container_width=True):
-                self._export_current_results()
-
-        # 创建数据框
-        df = pd.DataFrame(st.session_state.current_results)
-
-        # 调整列顺序
-        column_order = ['费用所属月份(审核月份)', '事业部', '大项目', '文件名', '姓名', '发票代码', '发票号码',
-                        '开票日期', '金额', '税率', '税额', '价税合计', '状态']
-        # 然后过滤掉不存在的列（确保代码健壮性）：
-        existing_columns = [col for col in column_order if col in df.columns]
-        df = df[existing_columns + [col for col in df.columns if col not in existing_columns]]
-
-        # 🔧 新增：固定值下拉框 - 事业部
-        fixed_depts = ["第一事业部", "第二事业部", "第三事业部"]
-        selected_dept = st.selectbox(
-            "选择 事业部:",
-            options=["全部"] + fixed_depts,
-            index=0,  # 默认选择“全部”
-            key="filter_dept"
-        )
-
-        # 🔧 新增：固定值下拉框 - 大项目
-        fixed_projects = ["深圳网优代维项目", "河源网优代维项目"]
-        selected_project = st.selectbox(
-            "选择 大项目:",
-            options=["全部"] + fixed_projects,
-            index=0,  # 默认选择“全部”
-            key="filter_project"
-        )
-
-        # 🔧 新增：固定值下拉框 - 费用所属月份(审核月份)
-        # 获取所有唯一的费用所属月份
-        unique_months = sorted(list(set(
-            [r.get('费用所属月份_审核月份') for r in st.session_state.current_results
-             if r.get('费用所属月份_审核月份') is not None]
-        )))
+            percent_metric = st.empty()
+        status = st.empty()
+        results_placeholder = st.empty()
 
-        # 分页计算
-        total_pages = max(1, (len(df) + items_per_page - 1) // items_per_page)
-
-        # 分页导航
-        if total_pages > 1:
-            # 页码选择器
-            col1, col2, col3 = st.columns([1, 3, 1])
-            with col2:
-                page_options = list(range(1, total_pages + 1))
-                page = st.selectbox(
-                    "选择页码",
-                    options=page_options,
-                    format_func=lambda x: f"第 {x} 页（共 {total_pages} 页）",
-                    key="result_page_selector"
-                ) - 1
-
-            # 快速导航按钮
-            nav_col1, nav_col2, nav_col3, nav_col4, nav_col5 = st.columns(5)
-
-            with nav_col1:
-                if st.button("⏮️ 首页", use_container_width=True, disabled=page == 0):
-                    st.session_state.current_page = 0
-                    st.rerun()
-
-            with nav_col2:
-                if st.button("◀️ 上一页", use_container_width=True, disabled=page == 0):
-                    st.session_state.current_page = max(0, page - 1)
-                    st.rerun()
-
-            with nav_col3:
-                st.markdown(f"**第 {page + 1} 页**", help=f"共 {total_pages} 页")
-
-            with nav_col4:
-                if st.button("▶️ 下一页", use_container_width=True, disabled=page >= total_pages - 1):
-                    st.session_state.current_page = min(total_pages - 1, page + 1)
-                    st.rerun()
-
-            with nav_col5:
-                if st.button("⏭️ 末页", use_container_width=True, disabled=page >= total_pages - 1):
-                    st.session_state.current_page = total_pages - 1
-                    st.rerun()
-        else:
-            page = 0
+        last_flushed = -1
+        while True:
+            current_index = st.session_state.current_file_index
+            progress = current_index / total_files if total_files > 0 else 0
+            progress_bar.progress(progress)
+            processed_metric.metric("已处理", current_index)
+            percent_metric.metric("进度", f"{progress:.1%}")
+
+            # 每处理K个文件刷新一次结果预览（微批次），避免逐文件重绘表格
+            if current_index - last_flushed >= RESULTS_FLUSH_EVERY or current_index >= total_files:
+                if current_index > 0:
+                    results_placeholder.dataframe(
+                        self._results_frame().tail(RESULTS_FLUSH_EVERY), use_container_width=True)
+                last_flushed = current_index
+
+            if current_index >= total_files:
+                self._finish_processing()
+                return
 
-        # 显示当前页数据
-        start_idx = page * items_per_page
-        end_idx = min((page + 1) * items_per_page, len(df))
+            # 提交新任务（暂停时不提交）
+            self._submit_pending_files()
+            pending = st.session_state.pending_futures
+            if not pending:
+                # 已暂停且进行中的任务都已收集，等待用户继续
+                return
 
-        st.dataframe(
-            df.iloc[start_idx:end_idx],
-            use_container_width=True,
-            height=min(600, items_per_page * 35)  # 动态调整高度
+            # 等待最早提交的任务完成，再按顺序收集
+            wait([pending[0]], timeout=PROCESS_POLL_INTERVAL)
+            self._drain_completed(status)
+
+    def _drain_completed(self, status):
+        """按提交顺序收集已完成的任务结果"""
+        pending = st.session_state.pending_futures
+        total_files = len(st.session_state.file_paths)
+        errors = []
+        file_path = None
+        # 取出任务后先推进索引、记录结果，再调用 st.*：
+        # 用户点击暂停等操作会在 st 调用处中断运行，不能让索引与已取出的任务错位
+        while pending and pending[0].done():
+            future = pending.popleft()
+            index = st.session_state.current_file_index
+            st.session_state.current_file_index += 1
+            file_path = st.session_state.file_paths[index]
+            try:
+                result = future.result()
+            except BrokenProcessPool as e:
+                # 工作进程异常退出后进程池不可再用：剩余文件记为失败，本批正常结束
+                errors.append(f"❌ 进程池异常终止，剩余 {total_files - index} 个文件未处理: {str(e)}")
+                st.session_state.current_file_index = index
+                self._fail_remaining(f'失败: 进程池异常终止 ({e})')
+                break
+            except Exception as e:
+                errors.append(f"❌ 处理文件失败: {os.path.basename(file_path)} - {str(e)}")
+                continue
+            self._remember_result(st.session_state.file_digests[index], result)
+            self._record_result(result)
+
+        for message in errors:
+            st.error(message)
+        if file_path is not None:
+            status.text(f"{st.session_state.current_file_index}/{total_files}: {os.path.basename(file_path)}")
+
+    def _fail_remaining(self, status):
+        """关闭进程池，并将尚未收集结果的文件记为失败"""
+        self._shutdown_executor()
+        file_paths = st.session_state.file_paths
+        extract_time = datetime.datetime.now().strftime('%Y/%m/%d %H:%M:%S')
+        while st.session_state.current_file_index < len(file_paths):
+            filename = os.path.basename(file_paths[st.session_state.current_file_index])
+            st.session_state.current_file_index += 1
+            self._record_result({
+                '文件名': filename,
+                '姓名': self.extractor.extract_person_name(filename),
+                '提取时间': extract_time,
+                '状态': status,
+            })
+
+    def _finish_processing(self):
+        """全部文件处理完成：关闭进程池、记录日志并刷新界面"""
+        st.session_state.processing = False
+        self._shutdown_executor()
+        self.invoice_writer.flush()  # 确保本批结果全部入库
+        st.balloons()
+        # 记录完成日志
+        success_count = st.session_state.success_count
+        self.system_service.log_operation(
+            st.session_state.user_id,
+            "批量处理完成",
+            f"成功处理 {success_count}/{len(st.session_state.file_paths)} 个文件"
         )
+        # 刷新界面（更新控制按钮状态并显示完整结果）
+        st.rerun()
 
-        # 分页信息
-        if total_pages > 1:
-            st.success(f"📄 显示第 **{start_idx + 1} - {end_idx}** 条记录，共 **{len(df)}** 条记录")
-
+    def _remember_result(self, digest, result):
+        """缓存提取成功的结果，供内容相同的文件复用"""
+        if not digest or result.get('状态') != '成功':
+            return
+        cache = _extraction_cache()
+        if digest not in cache and len(cache) >= EXTRACTION_CACHE_MAX:
+            cache.clear()
+        cache[digest] = dict(result)
+
+    def _record_result(self, basic_result):
+        """合并用户选项、保存并记录单个文件的提取结果"""
+        # 1. ✅ 从 session_state 获取用户手动选择的值
+        user_options = st.session_state.get("user_selected_options", {})
+        selected_bu = user_options.get("事业部", "未选择事业部")
+        selected_project = user_options.get("大项目", "未选择大项目")
+        selected_audit_month = user_options.get("费用所属月份(审核月份)", "未选择月份")
+
+        # 2. 关键：将这些用户选择的值，手动添加到 result 字典中
+        basic_result['事业部'] = selected_bu
+        basic_result['大项目'] = selected_project
+        basic_result['费用所属月份(审核月份)'] = selected_audit_month
+
+        # 3. 保存到数据库（交给后台写线程按批入库）
+        if basic_result.get('状态') == '成功':
+            self.invoice_writer.put(basic_result, st.session_state.user_id)
+
+        #  4. 添加到当前结果列表（用于前端展示）
+        st.session_state.current_results.append(basic_result)
+        if basic_result.get('状态') == '成功':
+            st.session_state.success_count += 1
+        self._touch_metrics()
+
+    @st.fragment
     def _show_current_results_advanced(self):
-        """显示当前处理结果 """
+        """显示当前处理结果（fragment：分页等操作只重新运行结果区域）"""
         st.markdown("### 📋 当前处理结果")
 
         if not st.session_state.current_results:
@@ -1185,21 +1383,15 @@ class FrontendApp:
                 if st.button("📥 导出全部", type="primary", use_container_width=True):
                     self._export_current_results()
 
-        # 创建数据框
-        df = pd.DataFrame(st.session_state.current_results)
-        # 调整列顺序
-        column_order = ['费用所属月份(审核月份)', '事业部', '大项目', '文件名', '姓名', '发票代码', '发票号码',
-                        '开票日期', '金额', '税率', '税额', '价税合计',
-                        '状态']
-        existing_columns = [col for col in column_order if col in df.columns]
-        df = df[existing_columns + [col for col in df.columns if col not in existing_columns]]
+        # 获取数据框（缓存，只追加新结果）
+        df = self._results_frame()
         # 分页计算
         total_pages = max(1, (len(df) + items_per_page - 1) // items_per_page)
         # 确保当前页不超出范围
         current_page = st.session_state.current_page
         if current_page >= total_pages:
-            st.session_state.current_page = total_pages - 1
-            st.rerun()
+            current_page = total_pages - 1
+            st.session_state.current_page = current_page
 
         st.markdown("#### 📊 数据表格")
         # 第二行：分页导航（行式布局）
@@ -1218,52 +1410,39 @@ class FrontendApp:
             with col3:
                 st.write(f"**总计：{len(df)} 条记录**")
 
-            # 分页按钮行（关键修复：正确的按钮逻辑）
+            # 分页按钮行：翻页在回调中完成，fragment 内的点击本身只重跑结果区域，无需 st.rerun
             if total_pages > 1:
-                # 使用表单确保按钮点击能触发rerun
-                with st.form("pagination_form"):
-                    btn_col1, btn_col2, btn_col3, btn_col4, btn_col5 = st.columns([1, 1, 2, 1, 1])
-
-                    with btn_col1:
-                        if st.form_submit_button("⏮️ 首页", use_container_width=True,
-                                                 disabled=current_page == 0):
-                            st.session_state.current_page = 0
-                            st.rerun()
-
-                    with btn_col2:
-                        if st.form_submit_button("◀️ 上一页", use_container_width=True,
-                                                 disabled=current_page == 0):
-                            st.session_state.current_page = max(0, current_page - 1)
-                            st.rerun()
-
-                    with btn_col3:
-                        # 页码选择器
-                        new_page = st.selectbox(
-                            "选择页码",
-                            options=list(range(1, total_pages + 1)),
-                            index=current_page,
-                            label_visibility="collapsed",  # 隐藏标签
-                            key="page_selector"
-                        ) - 1
-
-                        # 检测页码变化
-                        if new_page != current_page:
-                            st.session_state.current_page = new_page
-                            st.rerun()
-
-                    with btn_col4:
-                        if st.form_submit_button("▶️ 下一页", use_container_width=True,
-                                                 disabled=current_page >= total_pages - 1):
-                            st.session_state.current_page = min(total_pages - 1, current_page + 1)
-                            st.rerun()
-
-                    with btn_col5:
-                        if st.form_submit_button("⏭️ 末页", use_container_width=True,
-                                                 disabled=current_page >= total_pages - 1):
-                            st.session_state.current_page = total_pages - 1
-                            st.rerun()
+                btn_col1, btn_col2, btn_col3, btn_col4, btn_col5 = st.columns([1, 1, 2, 1, 1])
+
+                with btn_col1:
+                    st.button("⏮️ 首页", use_container_width=True, disabled=current_page == 0,
+                              on_click=self._set_results_page, args=(0,))
+
+                with btn_col2:
+                    st.button("◀️ 上一页", use_container_width=True, disabled=current_page == 0,
+                              on_click=self._set_results_page, args=(current_page - 1,))
+
+                with btn_col3:
+                    # 页码选择器（与当前页保持同步）
+                    if st.session_state.get('page_selector') != current_page + 1:
+                        st.session_state.page_selector = current_page + 1
+                    st.selectbox(
+                        "选择页码",
+                        options=list(range(1, total_pages + 1)),
+                        label_visibility="collapsed",  # 隐藏标签
+                        key="page_selector",
+                        on_change=self._on_page_selected
+                    )
+
+                with btn_col4:
+                    st.button("▶️ 下一页", use_container_width=True, disabled=current_page >= total_pages - 1,
+                              on_click=self._set_results_page, args=(current_page + 1,))
+
+                with btn_col5:
+                    st.button("⏭️ 末页", use_container_width=True, disabled=current_page >= total_pages - 1,
+                              on_click=self._set_results_page, args=(total_pages - 1,))
         st.dataframe(
-            df.iloc[start_idx:end_idx],
+            df.iloc[start_idx:end_idx].reset_index(drop=True),
             use_container_width=True,
             height=min(600, items_per_page * 35)
         )
@@ -1272,9 +1451,42 @@ class FrontendApp:
         st.markdown("#### 📈 处理统计")
         self._show_simple_statistics()
 
+    @staticmethod
+    def _set_results_page(page):
+        """分页按钮回调：切换到指定页"""
+        st.session_state.current_page = page
+
+    @staticmethod
+    def _on_page_selected():
+        """页码选择器回调：切换到所选页"""
+        st.session_state.current_page = st.session_state.page_selector - 1
+
+    def _results_frame(self):
+        """返回当前结果的DataFrame（缓存在session_state中，只为新增结果构建行）"""
+        results = st.session_state.current_results
+        df = st.session_state.results_df
+        built = 0 if df is None else len(df)
+        if built > len(results):
+            # 结果已被清空或重置，重新构建
+            df, built = None, 0
+        if df is None or built < len(results):
+            new_rows = pd.DataFrame(results[built:])
+            if '状态' in new_rows:
+                new_rows['状态'] = new_rows['状态'].astype('category')
+            df = new_rows if df is None else pd.concat([df, new_rows], ignore_index=True)
+            # 类别不一致时拼接结果会退化为object，重新转换
+            if '状态' in df and not isinstance(df['状态'].dtype, pd.CategoricalDtype):
+                df['状态'] = df['状态'].astype('category')
+            # 调整列顺序（只在出现新列、顺序变化时才重排）
+            columns = _ordered_columns(df.columns)
+            if columns != list(df.columns):
+                df = df[columns]
+            st.session_state.results_df = df
+        return df
+
     def _show_simple_statistics(self):
         """显示简化的统计信息"""
-        success_count = len([r for r in st.session_state.current_results if r.get('状态') == '成功'])
+        success_count = st.session_state.success_count
         total_count = len(st.session_state.current_results)
         success_rate = (success_count / total_count * 100) if total_count > 0 else 0
 
@@ -1357,20 +1569,13 @@ class FrontendApp:
 
         # 创建数据框 - 确保数据有效性
         try:
-            df = pd.DataFrame(st.session_state.current_results)
+            df = self._results_frame()
 
             # 检查数据完整性
             if df.empty:
                 st.warning("⚠️ 结果数据为空")
                 return
 
-            # 调整列顺序
-            column_order = ['费用所属月份(审核月份)', '事业部', '大项目', '文件名', '姓名', '发票代码', '发票号码',
-                            '开票日期', '金额', '税率', '税额', '价税合计',
-                            '状态']
-            existing_columns = [col for col in column_order if col in df.columns]
-            df = df[existing_columns + [col for col in df.columns if col not in existing_columns]]
-
             # 分页设置
             items_per_page = 20  # 每页显示20条记录
             total_pages = (len(df) + items_per_page - 1) // items_per_page
@@ -1394,7 +1599,7 @@ class FrontendApp:
             end_idx = min((page + 1) * items_per_page, len(df))
 
             # 显示当前页的数据
-            st.dataframe(df.iloc[start_idx:end_idx], use_container_width=True, height=600)
+            st.dataframe(df.iloc[start_idx:end_idx].reset_index(drop=True), use_container_width=True, height=600)
 
             # 显示分页信息
             if total_pages > 1:
@@ -1409,7 +1614,7 @@ class FrontendApp:
             st.json(st.session_state.current_results)
 
         # 统计信息
-        success_count = len([r for r in st.session_state.current_results if r.get('状态') == '成功'])
+        success_count = st.session_state.success_count
         total_count = len(st.session_state.current_results)
         success_rate = (success_count / total_count * 100) if total_count > 0 else 0
 
@@ -1433,26 +1638,18 @@ class FrontendApp:
             st.warning("⚠️ 没有可导出的数据")
             return
 
-        # 构造你想要的列顺序
-        desired_column_order = [
-            '费用所属月份(审核月份)', '事业部', '大项目', '文件名', '姓名',
-            '发票代码', '发票号码', '开票日期', '金额', '税率', '税额',
-            '价税合计', '状态'
-        ]
-        df = pd.DataFrame(st.session_state.current_results)
-        # 只保留你想要的列（防止意外字段干扰），并且按照指定顺序排列
-        # 如果某些列不存在，可以用 df.get(col, default=None) 或提前过滤
-        available_cols = [col for col in desired_column_order if col in df.columns]
-        df_export = df[available_cols]
-        # 导出到 Excel
-        output = BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df_export.to_excel(writer, index=False, sheet_name='发票数据')
-
-        excel_data = output.getvalue()
-        b64 = base64.b64encode(excel_data).decode()
-        href = f'<a href="data:application/vnd.openxmlformats-officedocument.spreadsheetml.sheet;base64,{b64}" download="当前发票提取结果.xlsx">点击下载Excel文件</a>'
-        st.markdown(href, unsafe_allow_html=True)
+        results = st.session_state.current_results
+        # 只保留 COLUMN_ORDER 中的列（防止意外字段干扰），并且按照指定顺序排列
+        present_cols = set().union(*results)
+        available_cols = [col for col in COLUMN_ORDER if col in present_cols]
+        # 导出到 Excel（结果未变时直接复用缓存的字节）
+        excel_data = _build_export_bytes(st.session_state.results_version, results, available_cols)
+        st.download_button(
+            label="点击下载Excel文件",
+            data=excel_data,
+            file_name="当前发票提取结果.xlsx",
+            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        )
 
     def _file_upload_section(self):
         """文件上传区域"""
@@ -1504,7 +1701,7 @@ class FrontendApp:
             st.session_state.file_source = "folder"
 
             if os.path.exists(folder_path):
-                pdf_files = [f for f in os.listdir(folder_path) if f.lower().endswith('.pdf')]
+                pdf_files = _folder_pdfs(folder_path)
                 if pdf_files:
                     st.success(f"✅ 找到 {len(pdf_files)} 个PDF文件")
                 else:
@@ -1559,11 +1756,12 @@ class FrontendApp:
             st.info("📊 没有可分析的数据，请先处理发票文件")
             return
 
-        df = pd.DataFrame(st.session_state.current_results)
+        import plotly.express as px  # 只在打开分析页时加载
+        df = self._results_frame()
 
         # 总体统计
         st.markdown("### 📊 总体统计")
-        success_count = len([r for r in st.session_state.current_results if r.get('状态') == '成功'])
+        success_count = st.session_state.success_count
         total_count = len(st.session_state.current_results)
         success_rate = (success_count / total_count * 100) if total_count > 0 else 0
 
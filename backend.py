@@ -7,17 +7,34 @@ import datetime
 import logging
 import sqlite3
 import hashlib
-import jwt
-from typing import Dict, List, Tuple, Optional
+import hmac
+import queue
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
+from typing import TYPE_CHECKING, Dict, List, Tuple, Optional, Union
 from dataclasses import dataclass
 from io import BytesIO
-import pdfplumber
-import pandas as pd
+
+# pandas / PyMuPDF / xlsxwriter / jwt 在用到的函数内导入，登录等页面不必加载
+if TYPE_CHECKING:
+    import pandas as pd
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# 密码哈希（argon2id）
+password_hasher = PasswordHasher()
+
+
+@lru_cache(maxsize=1)
+def _dummy_password_hash() -> str:
+    """用户不存在时用于校验的哈希，使其耗时与真实校验一致，避免通过响应时间探测用户名"""
+    return password_hasher.hash(os.urandom(16).hex())
+
 
 @dataclass
 class User:
@@ -63,14 +80,58 @@ class SystemConfig:
 class DatabaseManager:
     """数据库管理类"""
 
+    POOL_SIZE = 8  # 连接池保留的空闲连接数
+    BUSY_TIMEOUT = 30  # 等待写锁的秒数
+
     def __init__(self, db_path="invoice_system.db"):
         self.db_path = db_path
+        self._pool = queue.LifoQueue(maxsize=self.POOL_SIZE)
+        self._write_lock = threading.RLock()
         self.init_database()
+        self._enable_wal()
 
     def get_connection(self):
         """获取数据库连接"""
         return sqlite3.connect(self.db_path)
 
+    def _enable_wal(self):
+        """启用WAL模式（写入数据库文件，只需设置一次），读写互不阻塞"""
+        conn = self.get_connection()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+        except Exception as e:
+            logger.error(f"启用WAL模式错误: {e}")
+        finally:
+            conn.close()
+
+    def _new_connection(self):
+        """创建供连接池复用的连接（可跨线程使用）"""
+        conn = sqlite3.connect(self.db_path, timeout=self.BUSY_TIMEOUT, check_same_thread=False)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @contextmanager
+    def connection(self, write: bool = False):
+        """从连接池借出连接，用完归还而不关闭；write=True 时串行化本进程内的写操作"""
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            conn = self._new_connection()
+        try:
+            if write:
+                with self._write_lock:
+                    yield conn
+            else:
+                yield conn
+        finally:
+            # 未提交的事务（出错或遗漏commit）回滚后再归还
+            if conn.in_transaction:
+                conn.rollback()
+            try:
+                self._pool.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
     def init_database(self):
         """初始化数据库表 - 修复版本"""
         conn = self.get_connection()
@@ -149,6 +210,11 @@ class DatabaseManager:
                 )
             ''')
 
+            # 常用查询的索引
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_invoices_user_extracted ON invoices(user_id, extracted_at DESC)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_invoices_user_status ON invoices(user_id, status)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_ops_user ON operation_logs(user_id, created_at DESC)')
+
             # 插入默认数据
             self._insert_default_data(conn)
             conn.commit()
@@ -198,13 +264,14 @@ class DatabaseManager:
                 logger.info("添加email列到users表")
                 conn.execute('ALTER TABLE users ADD COLUMN email TEXT')
 
-            # 默认管理员用户
-            default_password = hashlib.sha256("admin123".encode()).hexdigest()
-            # default_password = "admin123"
-            conn.execute('''
-                INSERT OR IGNORE INTO users (username, password_hash, email) 
-                VALUES (?, ?, ?)
-            ''', ('admin', default_password, 'admin@invoice.com'))
+            # 默认管理员用户（仅在不存在时计算哈希，argon2 耗时较长）
+            if not conn.execute("SELECT 1 FROM users WHERE username = 'admin'").fetchone():
+                default_password = password_hasher.hash("admin123")
+                # default_password = "admin123"
+                conn.execute('''
+                    INSERT OR IGNORE INTO users (username, password_hash, email) 
+                    VALUES (?, ?, ?)
+                ''', ('admin', default_password, 'admin@invoice.com'))
 
             # 系统配置
             configs = [
@@ -258,104 +325,126 @@ class AuthService:
             'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=24),
             'iat': datetime.datetime.utcnow()
         }
+        import jwt
         return jwt.encode(payload, self.secret_key, algorithm='HS256')
 
     def verify_token(self, token: str) -> Optional[dict]:
         """验证JWT Token"""
+        import jwt
         try:
-            payload = jwt.decode(token, self.secret_key, algorithms=['HS256'])
+            payload = jwt.decode(token, self.secret_key, algorithms=['HS256'], leeway=10)
             return payload
         except jwt.ExpiredSignatureError:
             return None  # Token过期
         except jwt.InvalidTokenError:
             return None  # Token无效
 
+    @staticmethod
+    def _check_password(password: str, password_hash: str) -> Tuple[bool, Optional[str]]:
+        """校验密码，返回 (是否正确, 需要写回的新哈希)；兼容旧的SHA-256哈希"""
+        if password_hash.startswith('$argon2'):
+            try:
+                password_hasher.verify(password_hash, password)
+            except (VerificationError, InvalidHashError):
+                return False, None
+            if password_hasher.check_needs_rehash(password_hash):
+                return True, password_hasher.hash(password)
+            return True, None
+        # 旧版本保存的SHA-256哈希
+        if hmac.compare_digest(hashlib.sha256(password.encode()).hexdigest(), password_hash):
+            return True, password_hasher.hash(password)
+        return False, None
+
     def verify_user(self, username: str, password: str) -> Optional[User]:
         """验证用户并返回Token"""
-        conn = self.db_manager.get_connection()
         try:
-            cursor = conn.execute(
-                'SELECT id, username, password_hash, email FROM users WHERE username = ?',
-                (username,)
-            )
-            result = cursor.fetchone()
-
-            if result:
-                user_id, username, password_hash, email = result
-                # 简单的密码验证（实际应用中应该使用更安全的方式）
-                if hashlib.sha256(password.encode()).hexdigest() == password_hash:
-                    # 更新最后登录时间
+            with self.db_manager.connection() as conn:
+                result = conn.execute(
+                    'SELECT id, username, password_hash, email FROM users WHERE username = ?',
+                    (username,)
+                ).fetchone()
+            if not result:
+                # 用户不存在时同样执行一次校验，响应时间不泄露用户名是否存在
+                self._check_password(password, _dummy_password_hash())
+                return None
+
+            # 密码校验（argon2）耗时较长，在写锁之外完成，不阻塞其他会话的写入
+            user_id, username, password_hash, email = result
+            ok, new_hash = self._check_password(password, password_hash)
+            if not ok:
+                return None
+
+            with self.db_manager.connection(write=True) as conn:
+                # 旧格式或参数过时的哈希在登录成功时升级（期间密码被修改则不覆盖）
+                if new_hash:
                     conn.execute(
-                        'UPDATE users SET last_login = ? WHERE id = ?',
-                        (datetime.datetime.now(), user_id)
+                        'UPDATE users SET password_hash = ? WHERE id = ? AND password_hash = ?',
+                        (new_hash, user_id, password_hash)
                     )
-                    conn.commit()
-
-                    return User(
-                        id=user_id,
-                        username=username,
-                        email=email,
-                        created_at=datetime.datetime.now(),
-                        last_login=datetime.datetime.now()
-                    )
-            return None
+                # 更新最后登录时间
+                conn.execute(
+                    'UPDATE users SET last_login = ? WHERE id = ?',
+                    (datetime.datetime.now(), user_id)
+                )
+                conn.commit()
+
+            return User(
+                id=user_id,
+                username=username,
+                email=email,
+                created_at=datetime.datetime.now(),
+                last_login=datetime.datetime.now()
+            )
         except Exception as e:
             logger.error(f"用户验证错误: {e}")
             return None
-        finally:
-            conn.close()
 
 
 class InvoiceExtractor:
     """发票提取器类"""
 
+    # 预编译的固定正则
+    _CODE_RE = re.compile(r'发票代码\s*[:：]\s*(\d+)')
+    _NUMBER_RE = re.compile(r'发票号码\s*[:：]\s*(\d+)')
+    _TABLE_AMOUNT_RE = re.compile(r'(\d+\.\d{2})\s+(\d+)%\s+(\d+\.\d{2})')
+    _YUAN_RE = re.compile(r'[￥¥]\s*(\d+\.\d{2})')
+    _CHINESE_NAME_RE = re.compile(r'[\u4e00-\u9fa5]{2,4}')
+    # 开票日期：\s* 同时覆盖带空格和无空格两种格式
+    _DATE_RE = re.compile(r'开票日期\s*[:：]\s*(\d{4})\s*年\s*(\d{1,2})\s*月\s*(\d{1,2})\s*日')
+    # 文件名中的姓名：滴滴发票格式（可选前缀）或直接以姓名结尾
+    _NAME_RE = re.compile(r'(?:滴滴电子发票\d+[_-]\d+[_-])?([\u4e00-\u9fa5]{2,4})\.pdf$')
+
     def __init__(self):
-        self.date_patterns = self._init_date_patterns()
         self.amount_patterns = self._init_amount_patterns()
-        self.name_patterns = self._init_name_patterns()
 
-    def _init_date_patterns(self) -> List[Tuple[str, str]]:
+    def _init_amount_patterns(self) -> List[Tuple[re.Pattern, str]]:
         return [
-            (r'开票日期\s*[:：]\s*(\d{4})\s*年\s*(\d{1,2})\s*月\s*(\d{1,2})\s*日', '标准格式(带空格)'),
-            (r'开票日期\s*[:：]\s*(\d{4})年(\d{1,2})月(\d{1,2})日', '标准格式(无空格)'),
-        ]
-
-    def _init_amount_patterns(self) -> List[Tuple[str, str]]:
-        return [
-            (r'(\d+\.\d{2})\s+(\d+)%\s+(\d+\.\d{2})', '表格格式'),
-            (r'[￥¥]\s*(\d+\.\d{2})', '人民币符号'),
-        ]
-
-    def _init_name_patterns(self) -> List[Tuple[str, str]]:
-        return [
-            (r'滴滴电子发票\d+[_-]\d+[_-]([\u4e00-\u9fa5]{2,4})\.pdf$', '滴滴发票格式'),
-            (r'([\u4e00-\u9fa5]{2,4})\.pdf$', '直接匹配'),
+            (self._TABLE_AMOUNT_RE, '表格格式'),
+            (self._YUAN_RE, '人民币符号'),
         ]
 
     def extract_invoice_info(self, pdf_path: str) -> Dict:
         """提取发票信息"""
+        import fitz  # PyMuPDF
         try:
-            with pdfplumber.open(pdf_path) as pdf:
-                text = pdf.pages[0].extract_text()
+            with fitz.open(pdf_path) as doc:
+                text = doc[0].get_text("text")
 
             result = {}
 
             # 提取发票代码
-            code_match = re.search(r'发票代码\s*[:：]\s*(\d+)', text)
+            code_match = self._CODE_RE.search(text)
             result['发票代码'] = code_match.group(1) if code_match else ""
 
             # 提取发票号码
-            no_match = re.search(r'发票号码\s*[:：]\s*(\d+)', text)
+            no_match = self._NUMBER_RE.search(text)
             result['发票号码'] = no_match.group(1) if no_match else ""
 
             # 提取开票日期
-            date_match = None
-            for pattern, _ in self.date_patterns:
-                date_match = re.search(pattern, text)
-                if date_match:
-                    year, month, day = date_match.groups()
-                    result['开票日期'] = f"{year}/{month.zfill(2)}/{day.zfill(2)}"
-                    break
+            date_match = self._DATE_RE.search(text)
+            if date_match:
+                year, month, day = date_match.groups()
+                result['开票日期'] = f"{year}/{month.zfill(2)}/{day.zfill(2)}"
             else:
                 result['开票日期'] = ""
 
@@ -387,12 +476,12 @@ class InvoiceExtractor:
 
     def _extract_amounts(self, text: str) -> Tuple[Optional[float], Optional[float]]:
         # 表格格式匹配
-        table_match = re.search(r'(\d+\.\d{2})\s+(\d+)%\s+(\d+\.\d{2})', text)
+        table_match = self._TABLE_AMOUNT_RE.search(text)
         if table_match:
             return float(table_match.group(1)), float(table_match.group(3))
 
         # 人民币符号匹配
-        yuan_matches = re.findall(r'[￥¥]\s*(\d+\.\d{2})', text)
+        yuan_matches = self._YUAN_RE.findall(text)
         if len(yuan_matches) >= 2:
             return float(yuan_matches[0]), float(yuan_matches[1])
 
@@ -400,122 +489,196 @@ class InvoiceExtractor:
 
     def extract_person_name(self, filename: str) -> str:
         """从文件名提取姓名"""
-        for pattern, _ in self.name_patterns:
-            match = re.search(pattern, filename)
-            if match:
-                name = match.group(1)
-                if 2 <= len(name) <= 4:
-                    return name
+        match = self._NAME_RE.search(filename)
+        if match:
+            name = match.group(1)
+            if 2 <= len(name) <= 4:
+                return name
 
         # 备用方法
         name_without_ext = filename.replace('.pdf', '')
-        chinese_names = re.findall(r'[\u4e00-\u9fa5]{2,4}', name_without_ext)
+        chinese_names = self._CHINESE_NAME_RE.findall(name_without_ext)
         if chinese_names:
             return max(chinese_names, key=len)
         return "未知"
 
 
+# 子进程内复用的提取器实例
+_worker_extractor = None
+
+
+def extract_invoice_worker(pdf_path: str) -> Dict:
+    """提取单个发票文件信息（模块级函数，可被ProcessPoolExecutor在子进程中调用）"""
+    global _worker_extractor
+    if _worker_extractor is None:
+        _worker_extractor = InvoiceExtractor()
+    result = _worker_extractor.extract_invoice_info(pdf_path)
+    result['姓名'] = _worker_extractor.extract_person_name(os.path.basename(pdf_path))
+    return result
+
+
 class InvoiceService:
     """发票服务类"""
 
+    # get_user_invoices 可查询的列（也是 columns 参数的白名单）
+    INVOICE_COLUMNS = (
+        'id', 'filename', 'person_name', 'invoice_code', 'invoice_number', 'invoice_date',
+        'amount', 'tax_rate', 'tax_amount', 'total_amount', 'status', 'extracted_at',
+        'shenheyuefen', 'shiyebu', 'daxiangmu'
+    )
+
     def __init__(self, db_manager: DatabaseManager, extractor: InvoiceExtractor):
         self.db_manager = db_manager
         self.extractor = extractor
 
+    @staticmethod
+    def _invoice_row(result: Dict, user_id: int) -> Tuple:
+        """构造插入 invoices 表的值元组，确保字段都存在"""
+        return (
+            user_id,
+            result.get('费用所属月份(审核月份)', '未选择'),
+            result.get('事业部', '未选择'),
+            result.get('大项目', '未选择'),
+            result.get('文件名', '未命名'),
+            result.get('姓名', '未知'),
+            result.get('发票代码', ''),
+            result.get('发票号码', ''),
+            result.get('开票日期', ''),
+            result.get('金额', 0),
+            result.get('税率', 0),
+            result.get('税额', 0),
+            result.get('价税合计', 0),
+            result.get('状态', '失败'),
+            # 与提取结果相同的格式，get_user_invoices 按该格式做字符串比较
+            result.get('提取时间', datetime.datetime.now().strftime('%Y/%m/%d %H:%M:%S'))
+        )
+
     def _save_to_database(self, result: Dict, user_id: int):
         """保存到数据库"""
-        required_fields = [
-            '文件名', '姓名', '发票代码', '发票号码', '开票日期',
-            '金额', '税率', '税额', '价税合计', '状态', '提取时间'
-        ]
-        optional_fields = [
-            '费用所属月份(审核月份)', '事业部', '大项目'
-        ]
-        conn = self.db_manager.get_connection()
+        self.save_many([result], user_id)
+
+    def save_many(self, results: List[Dict], user_id: int):
+        """批量保存到数据库（一次 executemany，一个事务）"""
+        self.save_rows([self._invoice_row(r, user_id) for r in results])
+
+    def save_rows(self, rows: List[Tuple]):
+        """在单个事务中写入已构造好的值元组（见 _invoice_row）"""
+        if not rows:
+            return
         try:
-            # 构造值元组，确保字段都存在
-            values = (
-                user_id,
-                result.get('费用所属月份(审核月份)', '未选择'),
-                result.get('事业部', '未选择'),
-                result.get('大项目', '未选择'),
-                result.get('文件名', '未命名'),
-                result.get('姓名', '未知'),
-                result.get('发票代码', ''),
-                result.get('发票号码', ''),
-                result.get('开票日期', ''),
-                result.get('金额', 0),
-                result.get('税率', 0),
-                result.get('税额', 0),
-                result.get('价税合计', 0),
-                result.get('状态', '失败'),
-                result.get('提取时间', datetime.datetime.now().isoformat())
-            )
-            conn.execute('''
-                       INSERT INTO invoices (
-                           user_id, shenheyuefen, shiyebu, daxiangmu, filename, person_name, invoice_code, invoice_number,
-                           invoice_date, amount, tax_rate, tax_amount, total_amount, status, extracted_at
-                       ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                   ''', values)
-            conn.commit()
-            # logger.info("✅ 发票数据保存数据库成功")
+            with self.db_manager.connection(write=True) as conn:
+                with conn:  # 事务：成功提交，出错回滚
+                    conn.executemany('''
+                               INSERT INTO invoices (
+                                   user_id, shenheyuefen, shiyebu, daxiangmu, filename, person_name, invoice_code, invoice_number,
+                                   invoice_date, amount, tax_rate, tax_amount, total_amount, status, extracted_at
+                               ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                           ''', rows)
+                # logger.info("✅ 发票数据保存数据库成功")
         except Exception as e:
             logger.error(f"保存发票数据错误: {e}")
-        finally:
-            conn.close()
 
-    def get_user_invoices(self, user_id: int, days: int = 30) -> List[Dict]:
-        """获取用户发票数据"""
-        conn = self.db_manager.get_connection()
+    def get_user_invoices(self, user_id: int, days: int = 30,
+                          columns: Optional[List[str]] = None) -> 'pd.DataFrame':
+        """获取用户发票数据（直接读取为DataFrame），columns 为空时返回 INVOICE_COLUMNS 全部列"""
+        import pandas as pd
+        columns = list(columns) if columns else list(self.INVOICE_COLUMNS)
+        unknown = [c for c in columns if c not in self.INVOICE_COLUMNS]
+        if unknown:
+            raise ValueError(f"不支持的列: {unknown}")
+        # extracted_at 按 '%Y/%m/%d %H:%M:%S' 存储，按同样格式的日期前缀比较即可走索引
+        since = (datetime.date.today() - datetime.timedelta(days=days)).strftime('%Y/%m/%d')
         try:
-            cursor = conn.execute('''
-                SELECT * FROM invoices 
-                WHERE user_id = ? AND date(created_at) >= date('now', ?) 
-                ORDER BY created_at DESC
-            ''', (user_id, f'-{days} days'))
-
-            columns = [col[0] for col in cursor.description]
-            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+            with self.db_manager.connection() as conn:
+                # 列名均来自白名单，可以安全地拼接进 SQL
+                return pd.read_sql_query(f'''
+                    SELECT {', '.join(columns)} FROM invoices 
+                    WHERE user_id = ? AND extracted_at >= ? 
+                    ORDER BY extracted_at DESC
+                ''', conn, params=(user_id, since))
         except Exception as e:
             logger.error(f"获取用户发票数据错误: {e}")
-            return []
-        finally:
-            conn.close()
+            return pd.DataFrame()
 
     def get_statistics(self, user_id: int) -> Dict:
         """获取统计信息"""
-        conn = self.db_manager.get_connection()
         try:
-            cursor = conn.execute('''
-                SELECT 
-                    COUNT(*) as total_files,
-                    SUM(CASE WHEN status = '成功' THEN 1 ELSE 0 END) as success_files,
-                    SUM(amount) as total_amount,
-                    SUM(tax_amount) as total_tax
-                FROM invoices 
-                WHERE user_id = ?
-            ''', (user_id,))
-
-            result = cursor.fetchone()
-            if result:
-                total_files, success_files, total_amount, total_tax = result
-                success_rate = (success_files / total_files) * 100 if total_files > 0 else 0
-
-                return {
-                    '总文件数': total_files,
-                    '成功数': success_files,
-                    '失败数': total_files - success_files,
-                    '总金额': total_amount or 0,
-                    '总税额': total_tax or 0,
-                    '总价税合计': (total_amount or 0) + (total_tax or 0),
-                    '成功率': success_rate
-                }
-            return {}
+            with self.db_manager.connection() as conn:
+                cursor = conn.execute('''
+                    SELECT 
+                        COUNT(*) as total_files,
+                        SUM(CASE WHEN status = '成功' THEN 1 ELSE 0 END) as success_files,
+                        SUM(amount) as total_amount,
+                        SUM(tax_amount) as total_tax
+                    FROM invoices 
+                    WHERE user_id = ?
+                ''', (user_id,))
+
+                result = cursor.fetchone()
+                if result:
+                    total_files, success_files, total_amount, total_tax = result
+                    success_rate = (success_files / total_files) * 100 if total_files > 0 else 0
+
+                    return {
+                        '总文件数': total_files,
+                        '成功数': success_files,
+                        '失败数': total_files - success_files,
+                        '总金额': total_amount or 0,
+                        '总税额': total_tax or 0,
+                        '总价税合计': (total_amount or 0) + (total_tax or 0),
+                        '成功率': success_rate
+                    }
+                return {}
         except Exception as e:
             logger.error(f"获取统计信息错误: {e}")
             return {}
-        finally:
-            conn.close()
+
+
+class InvoiceWriter:
+    """后台批量写入发票数据：结果先放入队列，由写线程按批 executemany 入库"""
+
+    def __init__(self, invoice_service: InvoiceService, batch_size: int = 50, linger: float = 1.0):
+        self.invoice_service = invoice_service
+        self.batch_size = batch_size
+        self.linger = linger  # 凑批时最多等待的秒数
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="invoice-writer", daemon=True)
+        self._thread.start()
+
+    def put(self, result: Dict, user_id: int):
+        """提交一条结果，稍后由写线程入库"""
+        self._queue.put((dict(result), user_id))
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """等待此前提交的结果全部写入数据库"""
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def _run(self):
+        while True:
+            batch, waiters = [], []
+            item = self._queue.get()
+            deadline = time.monotonic() + self.linger
+            while True:
+                if isinstance(item, threading.Event):
+                    waiters.append(item)
+                    break
+                batch.append(item)
+                remaining = deadline - time.monotonic()
+                if len(batch) >= self.batch_size or remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            self._write(batch)
+            for done in waiters:
+                done.set()
+
+    def _write(self, batch: List[Tuple[Dict, int]]):
+        """在一个事务中写入一批结果（可包含多个用户）"""
+        self.invoice_service.save_rows([InvoiceService._invoice_row(r, user_id) for r, user_id in batch])
 
 
 class SystemService:
@@ -526,74 +689,93 @@ class SystemService:
 
     def get_menu_functions(self) -> List[Dict]:
         """获取菜单功能列表"""
-        conn = self.db_manager.get_connection()
         try:
-            cursor = conn.execute('''
-                SELECT function_name, icon, description 
-                FROM menu_functions 
-                WHERE is_active = 1 
-                ORDER BY sort_order
-            ''')
-            return [dict(zip(['name', 'icon', 'description'], row)) for row in cursor.fetchall()]
+            with self.db_manager.connection() as conn:
+                cursor = conn.execute('''
+                    SELECT function_name, icon, description 
+                    FROM menu_functions 
+                    WHERE is_active = 1 
+                    ORDER BY sort_order
+                ''')
+                return [dict(zip(['name', 'icon', 'description'], row)) for row in cursor.fetchall()]
         except Exception as e:
             logger.error(f"获取菜单功能错误: {e}")
             return []
-        finally:
-            conn.close()
 
     def get_system_config(self, key: str = None) -> Dict:
         """获取系统配置"""
-        conn = self.db_manager.get_connection()
         try:
-            if key:
-                cursor = conn.execute('SELECT config_key, config_value FROM system_config WHERE config_key = ?', (key,))
-                result = cursor.fetchone()
-                return {result[0]: result[1]} if result else {}
-            else:
-                cursor = conn.execute('SELECT config_key, config_value FROM system_config')
-                return {row[0]: row[1] for row in cursor.fetchall()}
+            with self.db_manager.connection() as conn:
+                if key:
+                    cursor = conn.execute('SELECT config_key, config_value FROM system_config WHERE config_key = ?', (key,))
+                    result = cursor.fetchone()
+                    return {result[0]: result[1]} if result else {}
+                else:
+                    cursor = conn.execute('SELECT config_key, config_value FROM system_config')
+                    return {row[0]: row[1] for row in cursor.fetchall()}
         except Exception as e:
             logger.error(f"获取系统配置错误: {e}")
             return {}
-        finally:
-            conn.close()
 
     def log_operation(self, user_id: int, operation_type: str, detail: str, ip_address: str = ""):
         """记录操作日志"""
-        conn = self.db_manager.get_connection()
         try:
-            conn.execute('''
-                INSERT INTO operation_logs (user_id, operation_type, operation_detail, ip_address)
-                VALUES (?, ?, ?, ?)
-            ''', (user_id, operation_type, detail, ip_address))
-            conn.commit()
+            with self.db_manager.connection(write=True) as conn:
+                conn.execute('''
+                    INSERT INTO operation_logs (user_id, operation_type, operation_detail, ip_address)
+                    VALUES (?, ?, ?, ?)
+                ''', (user_id, operation_type, detail, ip_address))
+                conn.commit()
         except Exception as e:
             logger.error(f"记录操作日志错误: {e}")
-        finally:
-            conn.close()
 
 
 class ExportService:
     """导出服务类"""
 
     @staticmethod
-    def export_to_excel(invoices: List[Dict]) -> BytesIO:
-        """导出到Excel"""
-        df = pd.DataFrame(invoices)
+    def export_to_excel(invoices: Union[List[Dict], 'pd.DataFrame']) -> BytesIO:
+        """导出到Excel（记录列表的列为所有字段的并集，按首次出现的顺序）"""
+        import pandas as pd
+        if isinstance(invoices, pd.DataFrame):
+            # 数据库读取的空值为NaN，xlsxwriter不能写NaN，写为空单元格
+            rows = ([None if v != v else v for v in row]
+                    for row in invoices.itertuples(index=False, name=None))
+            return ExportService._write_excel(list(invoices.columns), rows)
+        columns = list(dict.fromkeys(key for invoice in invoices for key in invoice))
+        return ExportService.export_rows_to_excel(invoices, columns)
+
+    @staticmethod
+    def export_rows_to_excel(rows: List[Dict], columns: List[str], sheet_name: str = '发票数据') -> BytesIO:
+        """按行导出到Excel（xlsxwriter constant_memory模式，逐行写出，内存占用恒定）"""
+        return ExportService._write_excel(columns, ([row.get(col, '') for col in columns] for row in rows), sheet_name)
+
+    @staticmethod
+    def _write_excel(columns: List[str], rows, sheet_name: str = '发票数据') -> BytesIO:
+        """写出表头和各行值列表"""
+        import xlsxwriter
         output = BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df.to_excel(writer, index=False, sheet_name='发票数据')
+        workbook = xlsxwriter.Workbook(output, {'constant_memory': True})
+        worksheet = workbook.add_worksheet(sheet_name)
+        worksheet.write_row(0, 0, columns)
+        for row_idx, values in enumerate(rows, start=1):
+            worksheet.write_row(row_idx, 0, values)
+        workbook.close()
         output.seek(0)
         return output
 
     @staticmethod
-    def export_to_csv(invoices: List[Dict]) -> str:
+    def export_to_csv(invoices: Union[List[Dict], 'pd.DataFrame']) -> str:
         """导出到CSV"""
-        df = pd.DataFrame(invoices)
-        return df.to_csv(index=False)
+        import pandas as pd
+        df = invoices if isinstance(invoices, pd.DataFrame) else pd.DataFrame(invoices)
+        return df.to_csv(index=False, chunksize=10000)
 
     @staticmethod
-    def export_to_json(invoices: List[Dict]) -> str:
+    def export_to_json(invoices: Union[List[Dict], 'pd.DataFrame']) -> str:
         """导出到JSON"""
+        import pandas as pd
+        if isinstance(invoices, pd.DataFrame):
+            return invoices.to_json(orient='records', force_ascii=False, indent=2)
         import json
         return json.dumps(invoices, ensure_ascii=False, indent=2)
\ No newline at end of file
@@ -8,89 +8,263 @@
 # backend/classification.py
 
 import os
+import re
+import errno
 import shutil
-import pdfplumber
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+import ahocorasick
+import fitz  # PyMuPDF
 
-def classify_pdfs(source_folder):
+try:
+    import hyperscan  # 可选：仅支持x86平台，未安装时使用Aho-Corasick
+except ImportError:
+    hyperscan = None
+
+# 发票类别及其关键词（按优先级排序）
+CATEGORIES = {
+    "地铁发票": ["地铁", "城市轨道", "轨道交通", "城市轨道交通服务", "地铁集团", "三号线"],
+    "高铁发票": ["铁路", "无座", "硬座", "二等座", "高铁", "动车", "火车票"],
+    "滴滴打车发票": ["客运服务", "客运服务费", "滴滴", "快车", "专车", "出租车"],
+    "顺丰发票": ["收派服务", "收派服务费", "快递服务", "收派", "物流", "顺丰"],
+    "通行费电子发票": ["通行费", "经营租赁", "高速公路", "ETC", "停车费"],
+    "餐饮发票": ["餐饮", "饭店", "餐厅", "食品", "外卖"],
+    "住宿发票": ["住宿", "酒店", "宾馆", "旅馆"],
+    "办公用品发票": ["办公用品", "文具", "打印", "复印", "纸张"],
+    "其他发票": []  # 默认分类
+}
+DEFAULT_CATEGORY = "其他发票"
+
+# 分类结果缓存：文件内容摘要 -> 类别（主进程内跨批次、跨会话复用）
+_CATEGORY_CACHE = {}
+CATEGORY_CACHE_MAX = 4096
+
+# 计算文件摘要时的读取块大小
+DIGEST_CHUNK = 1 << 20
+
+
+def _build_keyword_automaton():
+    """把所有类别关键词构建为一个Aho-Corasick自动机，值为(类别优先级, 类别名)"""
+    automaton = ahocorasick.Automaton()
+    for rank, (cat_name, keywords) in enumerate(CATEGORIES.items()):
+        for keyword in keywords:
+            word = keyword.lower()
+            if word not in automaton:  # 关键词重复时保留优先级更高的类别
+                automaton.add_word(word, (rank, cat_name))
+    automaton.make_automaton()
+    return automaton
+
+
+def _build_keyword_database():
+    """把所有类别关键词编译为一个Hyperscan数据库，模式id为类别优先级"""
+    expressions, ids = [], []
+    for rank, keywords in enumerate(CATEGORIES.values()):
+        for keyword in keywords:
+            expressions.append(re.escape(keyword.lower()).encode())
+            ids.append(rank)
+    database = hyperscan.Database()
+    database.compile(expressions=expressions, ids=ids, elements=len(expressions),
+                     flags=[hyperscan.HS_FLAG_SINGLEMATCH] * len(expressions))
+    return database
+
+
+_CATEGORY_NAMES = list(CATEGORIES)
+_KEYWORD_DATABASE = _build_keyword_database() if hyperscan else None
+_KEYWORD_AUTOMATON = None if hyperscan else _build_keyword_automaton()
+
+
+def _get_max_workers():
+    """获取并行分类使用的进程数（最多8个）"""
+    return min(os.cpu_count() or 1, 8)
+
+
+def _prepare_output(source_folder, output_folder=None):
+    """创建分类目标文件夹（默认为源文件夹下的临时文件夹），类别子文件夹在首次移入文件时创建"""
+    target = output_folder or os.path.join(source_folder, "temp_output")
+    os.makedirs(target, exist_ok=True)
+    return target
+
+
+def _list_pdf_names(folder):
+    """列出文件夹中的PDF文件名（scandir 自带文件类型，无需逐个stat）"""
+    with os.scandir(folder) as it:
+        return [e.name for e in it if e.name[-4:].lower() == '.pdf' and e.is_file()]
+
+
+def _replace(src, dst):
+    """移动文件或文件夹：同一文件系统内用os.replace原子完成，跨设备时回退到shutil.move"""
+    try:
+        os.replace(src, dst)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        shutil.move(src, dst)
+
+
+def classify_single_pdf(filepath):
+    """
+    根据单个PDF文件内容判断其类别（模块级函数，可被子进程调用）
+
+    :param filepath: PDF文件路径
+    :return: 类别名称，读取失败时返回None
+    """
+    try:
+        # 读取PDF内容
+        content = extract_first_page_text(filepath).lower()
+    except Exception as e:
+        print(f"处理文件 {os.path.basename(filepath)} 时出错: {e}")
+        return None
+
+    # 根据内容进行分类
+    return classify_text(content)
+
+
+def classify_text(content):
+    """
+    一次扫描文本，返回命中关键词中优先级最高的类别
+
+    :param content: 已转为小写的文本内容
+    :return: 类别名称，未命中任何关键词时返回默认分类
+    """
+    if _KEYWORD_DATABASE is not None:
+        return _classify_text_hyperscan(content)
+
+    best_rank, best_cat = len(CATEGORIES), DEFAULT_CATEGORY
+    for _, (rank, cat_name) in _KEYWORD_AUTOMATON.iter(content):
+        if rank < best_rank:
+            best_rank, best_cat = rank, cat_name
+            if rank == 0:
+                break
+    return best_cat
+
+
+def _classify_text_hyperscan(content):
+    """classify_text 的Hyperscan实现（SIMD扫描）"""
+    best = [len(CATEGORIES)]
+
+    def on_match(rank, start, end, flags, context):
+        if rank < best[0]:
+            best[0] = rank
+        return rank == 0  # 命中最高优先级时终止扫描
+
+    try:
+        _KEYWORD_DATABASE.scan(content.encode(), match_event_handler=on_match)
+    except hyperscan.ScanTerminated:
+        pass
+    return _CATEGORY_NAMES[best[0]] if best[0] < len(CATEGORIES) else DEFAULT_CATEGORY
+
+
+def _move_classified(source_folder, target, filename, category):
+    """将文件移动到分类文件夹"""
+    try:
+        src = os.path.join(source_folder, filename)
+        category_dir = os.path.join(target, category)
+        try:
+            _replace(src, os.path.join(category_dir, filename))
+        except FileNotFoundError:
+            # 类别文件夹尚未创建时建好后重试；源文件本身不存在则直接报错
+            if not os.path.exists(src):
+                raise
+            os.makedirs(category_dir, exist_ok=True)
+            _replace(src, os.path.join(category_dir, filename))
+        print(f"已分类: {filename} -> {category}")
+    except Exception as e:
+        print(f"处理文件 {filename} 时出错: {e}")
+
+
+def classify_pdfs(source_folder, output_folder=None):
     """
     根据PDF文件内容对发票进行分类
 
     :param source_folder: 包含PDF文件的源文件夹路径
-    :return: 分类结果的字典，键为类别，值为文件列表
+    :param output_folder: 分类结果文件夹，指定时直接分类到该文件夹，无需再调用move_to_output
+    :return: 分类文件夹路径（未指定output_folder时为临时分类文件夹）
     """
-    categories = {
-        "地铁发票": ["地铁", "城市轨道", "轨道交通", "城市轨道交通服务", "地铁集团", "三号线"],
-        "高铁发票": ["铁路", "无座", "硬座", "二等座", "高铁", "动车", "火车票"],
-        "滴滴打车发票": ["客运服务", "客运服务费", "滴滴", "快车", "专车", "出租车"],
-        "顺丰发票": ["收派服务", "收派服务费", "快递服务", "收派", "物流", "顺丰"],
-        "通行费电子发票": ["通行费", "经营租赁", "高速公路", "ETC", "停车费"],
-        "餐饮发票": ["餐饮", "饭店", "餐厅", "食品", "外卖"],
-        "住宿发票": ["住宿", "酒店", "宾馆", "旅馆"],
-        "办公用品发票": ["办公用品", "文具", "打印", "复印", "纸张"],
-        "其他发票": []  # 默认分类
-    }
-
-    temp_output = os.path.join(source_folder, "temp_output")
-    if not os.path.exists(temp_output):
-        os.makedirs(temp_output)
-
-    # 创建分类子文件夹
-    for category in categories.keys():
-        folder_path = os.path.join(temp_output, category)
-        if not os.path.exists(folder_path):
-            os.makedirs(folder_path)
+    temp_output = _prepare_output(source_folder, output_folder)
 
     # 遍历源文件夹中的所有PDF文件
-    for filename in os.listdir(source_folder):
-        if filename.lower().endswith('.pdf'):
-            filepath = os.path.join(source_folder, filename)
-
-            try:
-                # 读取PDF内容
-                content = extract_text_from_pdf(filepath).lower()
-
-                # 根据内容进行分类
-                category = "其他发票"  # 默认分类
-                for cat_name, keywords in categories.items():
-                    if cat_name == "其他发票":
-                        continue
-                    if contains_any(content, keywords):
-                        category = cat_name
-                        break
-
-                # 移动文件到临时分类文件夹
-                new_path = os.path.join(temp_output, category, filename)
-                os.rename(filepath, new_path)
-                print(f"已分类: {filename} -> {category}")
-
-            except Exception as e:
-                print(f"处理文件 {filename} 时出错: {e}")
-                continue
+    for filename in _list_pdf_names(source_folder):
+        category = classify_single_pdf(os.path.join(source_folder, filename))
+        if category is not None:
+            _move_classified(source_folder, temp_output, filename, category)
 
     return temp_output
 
-def contains_any(text, keywords):
+
+def file_digest(path):
+    """计算文件内容摘要（blake2b），内容相同的PDF复用提取和分类结果"""
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(DIGEST_CHUNK), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def classify_many(pdf_paths, max_workers=None):
     """
-    检查文本中是否包含任意关键词
+    使用多进程批量判断PDF类别，内容与之前分类过的文件相同时直接复用结果
 
-    :param text: 要检查的文本
-    :param keywords: 关键词列表
-    :return: 是否包含任意关键词
+    :param pdf_paths: PDF文件路径列表
+    :param max_workers: 进程数，默认最多8个
+    :return: 与输入顺序一致的类别列表（读取失败的为None）
     """
-    return any(keyword.lower() in text for keyword in keywords)
+    if not pdf_paths:
+        return []
+    digests = []
+    for path in pdf_paths:
+        try:
+            digests.append(file_digest(path))
+        except OSError:
+            digests.append(None)  # 读取失败的文件交给子进程处理并报告
+    categories = [_CATEGORY_CACHE.get(d) if d else None for d in digests]
+    todo = [i for i, category in enumerate(categories) if category is None]
+    if not todo:
+        return categories
 
-def extract_text_from_pdf(pdf_path):
+    workers = min(max_workers or _get_max_workers(), len(todo))
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        found = ex.map(classify_single_pdf, [pdf_paths[i] for i in todo], chunksize=4)
+        for i, category in zip(todo, found):
+            categories[i] = category
+            if category is not None and digests[i]:
+                if len(_CATEGORY_CACHE) >= CATEGORY_CACHE_MAX:
+                    _CATEGORY_CACHE.clear()
+                _CATEGORY_CACHE[digests[i]] = category
+    return categories
+
+
+def classify_pdfs_parallel(source_folder, output_folder=None):
     """
-    从PDF文件中提取文本内容
+    使用多进程并行对发票进行分类
+
+    :param source_folder: 包含PDF文件的源文件夹路径
+    :param output_folder: 分类结果文件夹，指定时直接分类到该文件夹，无需再调用move_to_output
+    :return: 分类文件夹路径（未指定output_folder时为临时分类文件夹）
+    """
+    temp_output = _prepare_output(source_folder, output_folder)
+
+    filenames = _list_pdf_names(source_folder)
+    if not filenames:
+        return temp_output
+
+    categories = classify_many([os.path.join(source_folder, f) for f in filenames])
+
+    # 文件移动在主进程中完成，避免多进程竞争
+    for filename, category in zip(filenames, categories):
+        if category is not None:
+            _move_classified(source_folder, temp_output, filename, category)
+
+    return temp_output
+
+def extract_first_page_text(pdf_path):
+    """
+    只提取PDF第一页的文本（发票为单页，分类关键词都在第一页）
 
     :param pdf_path: PDF文件路径
-    :return: 提取的文本内容
+    :return: 第一页的文本内容，空文档返回空字符串
     """
-    text = ""
-    with pdfplumber.open(pdf_path) as pdf:
-        for page in pdf.pages:
-            text += page.extract_text() or ""
-    return text
+    with fitz.open(pdf_path) as doc:
+        return doc[0].get_text("text") if doc.page_count else ""
 
 def move_to_output(temp_output_folder):
     """
@@ -104,20 +278,20 @@ def move_to_output(temp_output_folder):
         os.makedirs(output_folder)
 
     # 移动每个分类文件夹
-    for category in os.listdir(temp_output_folder):
-        src = os.path.join(temp_output_folder, category)
-        dst = os.path.join(output_folder, category)
-
-        # 如果目标文件夹已存在，合并内容
-        if os.path.exists(dst):
-            for filename in os.listdir(src):
-                src_file = os.path.join(src, filename)
-                dst_file = os.path.join(dst, filename)
-                if os.path.isfile(src_file):
-                    shutil.move(src_file, dst_file)
-            os.rmdir(src)  # 删除空文件夹
-        else:
-            shutil.move(src, dst)
+    with os.scandir(temp_output_folder) as categories:
+        for category in categories:
+            src = category.path
+            dst = os.path.join(output_folder, category.name)
+
+            # 如果目标文件夹已存在，合并内容
+            if os.path.exists(dst):
+                with os.scandir(src) as files:
+                    for f in files:
+                        if f.is_file():
+                            _replace(f.path, os.path.join(dst, f.name))
+                os.rmdir(src)  # 删除空文件夹
+            else:
+                _replace(src, dst)
 
     # 删除临时文件夹
     os.rmdir(temp_output_folder)